@@ -1,26 +1,92 @@
+import os
 import threading
 import time
 import uuid
 import zmq
 import random
 import psutil
+from core.protocol import RouterServer, dumps
+
+class _ProcStatCpu:
+    """CPU usage from the aggregate line of /proc/stat, kept open between reads"""
+
+    def __init__(self):
+        self._fd = os.open("/proc/stat", os.O_RDONLY)
+        try:
+            # First reading is the baseline, so the first sample covers time since startup
+            self._prev = self._read()
+        except Exception:
+            # The caller falls back to psutil; don't leave the fd behind
+            self.close()
+            raise
+
+    def _read(self):
+        # One pread of the start of the file and only the first ("cpu ...") line
+        # is parsed; psutil re-opens and parses the whole file every call
+        fields = os.pread(self._fd, 512, 0).split(b"\n", 1)[0].split()
+        # user nice system idle iowait irq softirq steal (guest time is already in user)
+        ticks = [int(f) for f in fields[1:9]]
+        return sum(ticks), ticks[3] + ticks[4]
+
+    def __call__(self):
+        total, idle = self._read()
+        busy = (total - self._prev[0]) - (idle - self._prev[1])
+        elapsed = max(total - self._prev[0], 1)
+        self._prev = (total, idle)
+        return 100.0 * busy / elapsed
+
+    def close(self):
+        """Release the /proc/stat descriptor"""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+def _cpu_reader():
+    """Non-blocking CPU usage reader: /proc/stat on Linux, psutil elsewhere"""
+    try:
+        return _ProcStatCpu()
+    except (OSError, ValueError, IndexError):
+        # Prime psutil's counters so the first non-blocking call
+        # compares against now instead of returning a meaningless 0.0
+        psutil.cpu_percent(interval=None)
+        return lambda: psutil.cpu_percent(interval=None)
+
+def _find_battery_file():
+    """Path of the first battery's capacity file on Linux, or None"""
+    supply_dir = "/sys/class/power_supply"
+    try:
+        for name in sorted(os.listdir(supply_dir)):
+            path = os.path.join(supply_dir, name, "capacity")
+            if name.startswith("BAT") and os.path.exists(path):
+                return path
+    except OSError:
+        pass
+    return None
+
+# Looked up once; psutil.sensors_battery() rescans the directory on every call
+_BATTERY_FILE = _find_battery_file()
 
 class DeviceNode:
     """Represents a device in the network that can process tasks"""
     
     def __init__(self, port=5555, broadcast_port=5556,is_coordinator=False):
         self.id = str(uuid.uuid4())
+        self.short_id = self.id[:8]  # For log lines and UI labels
         self.port = port
         self.broadcast_port = broadcast_port# For discovery
         self.is_coordinator = is_coordinator
         self.device_status = "Initializing"
         self.running = False
+        self._stop_event = threading.Event()
+        self._threads = []  # Joined by stop() before the sockets are closed
         
-        # ZeroMQ context
-        self.context = zmq.Context()
+        # ZeroMQ context (shared process-wide so all sockets use one set of IO threads)
+        self.context = zmq.Context.instance()
         
-        # For receiving tasks
-        self.socket = self.context.socket(zmq.REP)
+        # For receiving tasks. ROUTER instead of REP so a slow request
+        # doesn't hold up the ones queued behind it; requests run on a small pool
+        self.socket = self.context.socket(zmq.ROUTER)
+        self._server = RouterServer(self.socket, max_workers=os.cpu_count() or 1)
         
         # For device discovery
         self.pub = self.context.socket(zmq.PUB)
@@ -30,6 +96,14 @@ class DeviceNode:
         # Known devices on the network
         self.network = {}
         
+        # Pre-encoded discovery broadcast, rebuilt only when the status changes
+        self._discovery_bytes = None
+        self._discovery_status = None
+        
+        # Latest resource snapshot, refreshed once per second while running
+        self._cpu_percent = _cpu_reader()
+        self._profile = self._read_profile()
+        
     def start(self):
         """Start the device node"""
         try:
@@ -37,8 +111,9 @@ class DeviceNode:
             self.running = True
             self.device_status = "Active"
             
-            # Start message handling thread
-            threading.Thread(target=self._handle_messages, daemon=True).start()
+            # Start message handling and resource sampling threads
+            self._start_thread(self._handle_messages)
+            self._start_thread(self._sample_profile)
             
             # Start discovery service if not already running on these ports
             try:
@@ -46,57 +121,57 @@ class DeviceNode:
                 # Instead of binding to fixed broadcast ports like port+1, 
                 # use an alternate port that's less likely to conflict
                 self.pub.bind(f"tcp://*:{self.broadcast_port}")
-                threading.Thread(target=self._start_discovery, daemon=True).start()
+                self._start_thread(self._start_discovery)
                 print(f"Discovery service started on port {self.broadcast_port}")
             except zmq.error.ZMQError as e:
                 print(f"Could not bind discovery service to port {self.broadcast_port}: {e}")
                 print("Discovery service will not be available, but main functionality should work")
             
-            print(f"Device {self.id[:8]} started on port {self.port}")
+            print(f"Device {self.short_id} started on port {self.port}")
             return True
         except Exception as e:
             print(f"Failed to start device: {e}")
             self.device_status = "Error"
             return False
     
+    def _start_thread(self, target):
+        """Start a background thread that stop() waits for"""
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+    
     def _start_discovery(self):
         """Broadcast device presence and discover others"""
         while self.running:
             try:
-                # Broadcast device info
-                message = {
-                    "type": "discovery",
-                    "device_id": self.id,
-                    "port": self.port,
-                    "status": self.device_status,
-                    "is_coordinator": self.is_coordinator
-                }
-                self.pub.send_json(message)
-                time.sleep(2)
+                # Broadcast device info; only status can change between broadcasts
+                if self.device_status != self._discovery_status:
+                    self._discovery_status = self.device_status
+                    self._discovery_bytes = dumps({
+                        "type": "discovery",
+                        "device_id": self.id,
+                        "port": self.port,
+                        "status": self._discovery_status,
+                        "is_coordinator": self.is_coordinator
+                    })
+                self.pub.send(self._discovery_bytes)
+                # Wait between broadcasts, but wake immediately on stop()
+                if self._stop_event.wait(2):
+                    break
             except Exception as e:
                 print(f"Discovery error: {e}")
-                time.sleep(5)  # Longer delay on error
+                if self._stop_event.wait(5):  # Longer delay on error
+                    break
     
     def _handle_messages(self):
         """Handle incoming messages"""
         while self.running:
             try:
-                try:
-                    # Set a timeout for polling
-                    poller = zmq.Poller()
-                    poller.register(self.socket, zmq.POLLIN)
-                    
-                    # Poll with timeout
-                    socks = dict(poller.poll(1000))  # 1 second timeout
-                    
-                    if self.socket in socks and socks[self.socket] == zmq.POLLIN:
-                        message = self.socket.recv_json()
-                        response = self._process_message(message)
-                        self.socket.send_json(response)
-                except zmq.error.Again:
-                    # Timeout occurred, just continue loop
-                    pass
-                
+                # 1 second timeout so a stop is noticed even without traffic
+                request = self._server.poll(1000)
+                if request is not None:
+                    route, message, _ = request
+                    self._server.submit(route, message, self._process_message, message)
             except Exception as e:
                 print(f"Message handling error: {e}")
                 time.sleep(0.1)
@@ -115,7 +190,7 @@ class DeviceNode:
         
         elif msg_type == "status":
             return {
-                "id": self.id,
+                "device_id": self.id,  # "id" is the request id, as in discovery broadcasts
                 "status": self.device_status,
                 "profile": self.get_profile()
             }
@@ -124,10 +199,25 @@ class DeviceNode:
     
     def get_profile(self):
         """Get device profile including CPU, memory, etc."""
+        # Served from the background sampler so callers never touch psutil
+        return self._profile
+    
+    def _sample_profile(self):
+        """Refresh the cached profile once per second"""
+        while self.running:
+            self._profile = self._read_profile()
+            if self._stop_event.wait(1):
+                break
+    
+    def _read_profile(self):
+        """Read CPU, memory and battery usage from the system"""
         try:
+            memory = psutil.virtual_memory()
             profile = {
-                "cpu_percent": psutil.cpu_percent(interval=0.1),
-                "memory_percent": psutil.virtual_memory().percent,
+                # Non-blocking: usage since the previous call, no 100 ms stall
+                "cpu_percent": self._cpu_percent(),
+                "memory_percent": memory.percent,
+                "memory_total_mb": memory.total / (1024 * 1024),  # Lets the scheduler cap task memory
                 "battery": self._get_battery_level(),
             }
             return profile
@@ -141,6 +231,12 @@ class DeviceNode:
     
     def _get_battery_level(self):
         """Get battery level or simulate one if not available"""
+        if _BATTERY_FILE is not None:
+            try:
+                with open(_BATTERY_FILE, "rb") as f:
+                    return float(f.read())
+            except (OSError, ValueError):
+                pass
         try:
             battery = psutil.sensors_battery()
             if battery:
@@ -155,8 +251,17 @@ class DeviceNode:
         """Stop the device node"""
         self.running = False
         self.device_status = "Stopped"
-        time.sleep(0.5)  # Give threads time to close
-        self.socket.close()
+        self._stop_event.set()
+        # Wake the handler out of its poll, wait for every thread and in-flight
+        # request to finish, and only then close what they were using
+        self._server.wake()
+        for thread in self._threads:
+            thread.join()
+        self._server.close(wait=True)
         self.pub.close()
         self.sub.close()
-        print(f"Device {self.id[:8]} stopped")
\ No newline at end of file
+        # The psutil fallback has nothing to close
+        close_cpu = getattr(self._cpu_percent, "close", None)
+        if close_cpu is not None:
+            close_cpu()
+        print(f"Device {self.short_id} stopped")
\ No newline at end of file
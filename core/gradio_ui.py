@@ -1,7 +1,7 @@
 import gradio as gr
 import time
 import threading
-import random
+import sched
 import json
 import zmq
 import pandas as pd
@@ -10,9 +10,88 @@ from PIL import Image, ImageDraw, ImageFont
 import os
 from core.device import DeviceNode
 from core.scheduler import TaskScheduler
-from core.model import ModelInterface
+from core.model import ModelPool, top_k, top_k_detections
+from core.peer import run_peer
+from core.protocol import ZERO_COPY_MIN, dumps, loads
 import io
 import argparse
+import traceback
+import itertools
+from collections import Counter
+import bisect
+import functools
+import queue
+from concurrent.futures import Future, wait
+from socket import socketpair
+
+# Shared generator for the simulated metrics; draws are done a whole batch at a time
+_rng = np.random.default_rng()
+
+# Peer addresses to attempt connecting to: localhost peers for local testing and
+# remote peers. EDGESHIFT_PEERS (comma-separated) replaces the defaults
+PEER_ADDRESSES = [
+    "tcp://localhost:5556",  # Local peer 1
+    "tcp://localhost:5557",  # Local peer 2
+    # --- ADD THE REMOTE PEER ADDRESS HERE ---
+    "tcp://192.168.200.206:5556", # Added Computer B's IP and peer port
+    # ---------------------------------------
+]
+if os.environ.get("EDGESHIFT_PEERS"):
+    PEER_ADDRESSES = [address.strip() for address in os.environ["EDGESHIFT_PEERS"].split(",") if address.strip()]
+
+# EDGESHIFT_DEMO=1 fills the network stats with sample data instead of measured values
+DEMO_MODE = os.environ.get("EDGESHIFT_DEMO") == "1"
+
+# Heartbeats are the most frequent peer message, so only the request id is
+# formatted per send; everything else is encoded once here
+PING = {'type': 'ping'}
+PING_TEMPLATE = b'{"type":"ping","id":%d}'
+
+# Heartbeat round trip (seconds) at which a peer's estimated capability drops to zero
+PEER_RTT_MAX = 0.5
+
+# Seconds a peer gets to answer a task. The IO thread expires the request then;
+# process_image gives up waiting a little later in case that thread has died
+TASK_TIMEOUT = 2.0
+
+# Health is "Poor" up to 30%, "Fair" up to 50%, "Good" up to 80%, then "Excellent"
+_HEALTH_BUCKETS = (30, 50, 80)
+_HEALTH_LABELS = ("Poor", "Fair", "Good", "Excellent")
+
+@functools.lru_cache(maxsize=32)
+def _health_label(active_count, total):
+    """Network health text for a device count; cached since counts rarely change"""
+    if total == 0:
+        return "No Devices"
+    # bisect_left keeps the original strict '>' thresholds (exactly 80% is "Good")
+    idx = bisect.bisect_left(_HEALTH_BUCKETS, (active_count / total) * 100)
+    return f"{_HEALTH_LABELS[idx]} ({active_count}/{total} devices)"
+
+def _resolve_font(font_size):
+    """Find a truetype font for result labels; returns (font, needs_background)"""
+    # Try arial first, then other common font names/paths
+    for f_name in ("arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf",
+                   "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"):
+        if os.path.exists(f_name):
+            try:
+                return ImageFont.truetype(f_name, font_size), False  # Truetype usually fine
+            except Exception as e:
+                print(f"Error loading truetype font {f_name}: {e}. Trying the next one.")
+    print("No common truetype fonts found, using default.")
+    # The default font is hard to read on busy images, so draw a background behind it
+    return ImageFont.load_default(), True
+
+# Resolved once at import instead of probing the filesystem on every processed image
+_FONT, _NEEDS_BG = _resolve_font(25)
+_TEXT_BG = (0, 0, 0, 128)  # Semi-transparent black background
+_LABEL_TEMPLATE = "{}. {}: {:.2f}"
+
+@functools.lru_cache(maxsize=4)
+def _load_image(path, mtime_ns):
+    """Decode an image file; keyed on mtime so an edited file is read again"""
+    # Copy out of the context manager so the file handle is released right away
+    with Image.open(path) as im:
+        return im.copy()
 # Mock DeviceNode, TaskScheduler, and ModelInterface classes for standalone module
 # In your actual code, you'd import these from their respective modules
 
@@ -109,96 +188,79 @@ def create_interface(core):
                         detection_image = gr.Image(label="Detection Results")
         
         # Event handlers
-        def update_health_indicator():
+        # Status counts for the last device snapshot, keyed by when it was built
+        counts_cache = {'entry': (None, None)}
+        
+        def snapshot():
+            """Fetch the device rows once and count them by status in a single pass"""
+            # Sessions ticking within the same status-cache window share one count
+            built_at, devices = core.get_device_snapshot()
+            cached_at, cached_counts = counts_cache['entry']
+            if cached_at == built_at:
+                return devices, cached_counts
+            status_counts = Counter(device[1] for device in devices)
+            counts_cache['entry'] = (built_at, status_counts)
+            return devices, status_counts
+        
+        def update_health_indicator(status_counts):
             """Update network health indicator"""
-            devices = core.get_device_status()
-            active_count = len([d for d in devices if d[1] == 'Active'])
-            total = len(devices)
-            
-            if total == 0:
-                return "No Devices"
-            
-            health_percent = (active_count / total) * 100
-            
-            if health_percent > 80:
-                return f"Excellent ({active_count}/{total} devices)"
-            elif health_percent > 50:
-                return f"Good ({active_count}/{total} devices)"
-            elif health_percent > 30:
-                return f"Fair ({active_count}/{total} devices)"
-            else:
-                return f"Poor ({active_count}/{total} devices)"
+            return _health_label(status_counts['Active'], sum(status_counts.values()))
         
-        def update_network_stats():
+        def update_network_stats(status_counts):
             """Get updated network statistics"""
-            devices = core.get_device_status()
-            active_count = len([d for d in devices if d[1] == 'Active'])
-            disconnected = len([d for d in devices if d[1] == 'Disconnected'])
+            total = sum(status_counts.values())
+            active_count = status_counts['Active']
+            disconnected = status_counts['Disconnected']
+            
+            if DEMO_MODE:
+                pending_tasks = int(_rng.integers(0, 6))  # Sample data
+                latency = f"{_rng.uniform(5, 50):.1f}ms"  # Sample data
+            else:
+                pending_tasks, latency_ms = core.get_network_metrics()
+                latency = "N/A" if latency_ms is None else f"{latency_ms:.1f}ms"
             
             # Generate more comprehensive stats
             return {
-                "total_devices": len(devices),
+                "total_devices": total,
                 "active_devices": active_count,
                 "disconnected_devices": disconnected,
-                "network_health": f"{(active_count/max(1, len(devices))*100):.1f}%",
+                "network_health": f"{(active_count/max(1, total)*100):.1f}%",
                 "last_updated": time.strftime("%H:%M:%S"),
-                "pending_tasks": random.randint(0, 5),  # Sample data (would be real in full impl)
-                "average_latency": f"{random.uniform(5, 50):.1f}ms"  # Sample data
+                "pending_tasks": pending_tasks,
+                "average_latency": latency
             }
         
-        def update_device_distribution():
+        def update_device_distribution(status_counts):
             """Update the device distribution as text"""
-            devices = core.get_device_status()
-            
-            # Count devices by status
-            status_counts = {}
-            for device in devices:
-                status = device[1]
-                if status not in status_counts:
-                    status_counts[status] = 0
-                status_counts[status] += 1
-            
             # Create text representation
-            if status_counts:
-                text = "Device Status Distribution:\n"
-                total = sum(status_counts.values())
-                for status, count in status_counts.items():
-                    percentage = (count / total) * 100
-                    text += f"{status}: {count} ({percentage:.1f}%)\n"
-            else:
-                text = "No device data available"
+            if not status_counts:
+                return "No device data available"
             
-            return text
+            total = sum(status_counts.values())
+            return "Device Status Distribution:\n" + "".join(
+                f"{status}: {count} ({count / total * 100:.1f}%)\n"
+                for status, count in status_counts.items()
+            )
         
-        def update_activity_plot():
+        def update_activity_plot(status_counts):
             """Update the network activity plot with real metrics"""
-            # Get current device status
-            devices = core.get_device_status()
-            
             # Calculate real metrics
-            active_devices = len([d for d in devices if d[1] == 'Active'])
-            total_tasks = sum(1 for d in devices if d[1] == 'Active')
-            
-            # Get current time
-            current_time = time.strftime("%H:%M:%S")
+            active_devices = status_counts['Active']
+            total_tasks = active_devices
             
-            # Create DataFrame with real data
-            return pd.DataFrame({
-                "time": [current_time],
-                "Active": [active_devices],
-                "Tasks": [total_tasks],
-                "Load": [active_devices * 20]  # Simple load calculation
-            })
+            # Add the sample to the core's rolling history and plot the whole window
+            return core.record_activity(active_devices, total_tasks, active_devices * 20)  # Simple load calculation
         
         def handle_image_selection(upload_img, path_str):
             """Handle image selection from either upload or path"""
             if upload_img is not None:
                 # Use the uploaded image
                 return upload_img
-            elif path_str and os.path.exists(path_str):
-                # Use the image from the provided path
+            elif path_str:
+                # Use the image from the provided path (the preview and the process
+                # button usually ask for the same file, so decoded images are cached)
                 try:
-                    return Image.open(path_str)
+                    return _load_image(path_str, os.stat(path_str).st_mtime_ns)
                 except Exception as e:
                     return None
             return None
@@ -210,21 +272,10 @@ def create_interface(core):
             if image is None:
                 return "No valid image provided", {}, [], None, None
             
-            # Save temporary file if uploaded image
-            temp_path = ""
-            if upload_img is not None and path_str == "":
-                temp_path = "temp_uploaded_image.jpg"
-                # Ensure the temp directory exists
-                os.makedirs(os.path.dirname(temp_path) or '.', exist_ok=True)
-                image.save(temp_path)
-                path_to_use = temp_path
-            else:
-                path_to_use = path_str
+            # Uploaded images are already in memory; hand them to the model as-is
+            # instead of round-tripping through a temporary JPEG
+            source = "uploaded image" if upload_img is not None else path_str
             
-            # Ensure the file exists before processing
-            if not os.path.exists(path_to_use):
-                 return f"Error: Image file not found at {path_to_use}", {}, [], None, None
-
             try:
                 # Use the core's ModelInterface to process the image
                 # This is assuming ModelInterface is initialized in the EdgeShiftCore
@@ -249,36 +300,20 @@ def create_interface(core):
                 # suitable for combined_results, but let's simplify for just displaying
                 # the top predictions in the UI for now.
 
-                # Preprocess the image (ModelInterface expects a path)
-                input_data = core.model.preprocess_image(path_to_use)
-
-                # Run inference
-                core.model.interpreter.set_tensor(core.model.input_index, input_data)
-                core.model.interpreter.invoke()
-                output = core.model.interpreter.get_tensor(core.model.output_index)
+                # Run inference; the decoded image is resized straight into the
+                # interpreter's input buffer
+                output = core.model.classify(image)
 
                 # Get top predictions
-                if output.ndim == 2 and output.shape[0] == 1:
-                     output = output[0]
-
-                top_k = 5
-                top_k_idx = np.argsort(output)[-top_k:][::-1]
-
+                labels = core.model.labels
                 predictions = []
-                for idx in top_k_idx:
+                for idx, confidence in zip(*top_k(output, 5)):
                     # Ensure the index is within the bounds of the labels list
-                    if idx < len(core.model.labels):
-                        label = core.model.labels[idx]
-                        confidence = float(output[idx])
-                        predictions.append({
-                            'class': label,
-                            'confidence': confidence
-                        })
-                    else:
-                         predictions.append({
-                            'class': f"Unknown Label Index {idx}",
-                            'confidence': float(output[idx])
-                        })
+                    label = labels[idx] if idx < len(labels) else f"Unknown Label Index {idx}"
+                    predictions.append({
+                        'class': label,
+                        'confidence': confidence
+                    })
 
                 # Format results for display
                 result_text = "Top Predictions:\n"
@@ -287,7 +322,7 @@ def create_interface(core):
 
                 detailed_results = {
                     'predictions': predictions,
-                    'image_path': path_to_use,
+                    'image_path': source,
                     # Indicate this was local processing for the UI demo
                     'processing_mode': 'local_inference'
                 }
@@ -301,17 +336,12 @@ def create_interface(core):
                 # but we return an empty list to match the expected output structure.
                 assignment_display = [] # No assignments for local processing
 
-                # Clean up temp file
-                if temp_path and os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
                 # Return the results in the correct order
                 return result_text, detailed_results, assignment_display, image, detection_result_image
                 
             except Exception as e:
                 # Log the error for debugging
                 print(f"Error during image processing: {e}")
-                import traceback
                 traceback.print_exc()
                 return f"Error processing image: {str(e)}", {}, [], None, None
         
@@ -320,55 +350,12 @@ def create_interface(core):
             if image is None or not results:
                 return None
             
-            # Create a copy of the image to draw on
+            # Create a copy of the image to draw on (the original is shown in the UI too)
             img = image.copy()
-            draw = ImageDraw.Draw(img)
             
-            # Load a font (use default if not available)
-            try:
-                font_path = "arial.ttf"
-                font_size = 25 # You can adjust this value
-                font = ImageFont.load_default() # Start with default
-                draw_text_with_background = False # Assume no background needed initially
-
-                if os.path.exists(font_path):
-                    try:
-                        font = ImageFont.truetype(font_path, font_size)
-                        draw_text_with_background = False # Truetype usually fine
-                    except Exception as e:
-                         print(f"Error loading truetype font {font_path}: {e}. Falling back to default.")
-                         font = ImageFont.load_default()
-                         # If using default, consider background for readability
-                         draw_text_with_background = True # Might need background for default font
-
-                else:
-                     # Try other common font names if arial.ttf isn't found
-                     common_fonts = ["Arial.ttf", "LiberationSans-Regular.ttf", "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"] # Add other common paths/names
-                     font_loaded = False
-                     for f_name in common_fonts:
-                         if os.path.exists(f_name):
-                            try:
-                                font = ImageFont.truetype(f_name, font_size)
-                                draw_text_with_background = False
-                                font_loaded = True
-                                break
-                            except:
-                                continue
-                     if not font_loaded:
-                         print("No common truetype fonts found, using default.")
-                         font = ImageFont.load_default()
-                         draw_text_with_background = True # Might need background for default font
-
-                # If using default font, make sure image is RGBA to draw with alpha background
-                if draw_text_with_background and img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-                    draw = ImageDraw.Draw(img) # Re-create draw object for RGBA image
-                    bg_color = (0, 0, 0, 128) # Semi-transparent black background
-
-            except Exception as e:
-                 print(f"Unexpected error during font loading: {e}. Using default font without background.")
-                 font = ImageFont.load_default()
-                 draw_text_with_background = False # Fallback to default without background
+            font = _FONT
+            draw_text_with_background = _NEEDS_BG
+            bg_color = _TEXT_BG
 
             # Determine text color based on confidence (optional)
             def get_text_color(confidence):
@@ -377,73 +364,104 @@ def create_interface(core):
             # Get predictions, expecting a list of dicts with 'class' and 'confidence'
             predictions = results.get('predictions', [])
             
-            top_k = 5 # Define top_k within this function
+            max_labels = 5 # Most predictions drawn on the image
 
             # Draw predictions at the top of the image
             y_offset = 10
             x_offset = 10 # Starting from the left
-            img_width, img_height = img.size
+            padding = 5
+
+            # Limit the number of predictions drawn on the image if there are too many
+            lines = [(_LABEL_TEMPLATE.format(i + 1, pred.get('class', 'Unknown'), pred.get('confidence', 0)),
+                      get_text_color(pred.get('confidence', 0)))
+                     for i, pred in enumerate(predictions[:max_labels])]
+            if not lines:
+                return img
 
-            for i, pred in enumerate(predictions):
-                # Limit the number of predictions drawn on the image if there are too many
-                if i >= top_k: # Now top_k is defined here
-                     break
-                     
-                label = f"{i+1}. {pred.get('class', 'Unknown')}: {pred.get('confidence', 0):.2f}"
-                text_color = get_text_color(pred.get('confidence', 0))
+            try:
+                # Measure every label up front; one bbox sizes both its background and the line advance
+                sizes = []
+                for label, _ in lines:
+                    left, top, right, bottom = font.getbbox(label)
+                    sizes.append((right - left, bottom - top))
+            except Exception as bbox_e:
+                # Fallback if measuring fails: plain text with an estimated line height
+                print(f"Error calculating text bbox: {bbox_e}. Drawing text without background.")
+                draw = ImageDraw.Draw(img)
+                for label, text_color in lines:
+                    draw.text((x_offset, y_offset), label, fill=text_color, font=font)
+                    y_offset += 20 + padding # Estimate height + padding
+                return img
 
+            if draw_text_with_background and img.mode == 'RGB':
+                # Draw onto a transparent layer covering just the text block and blend it in,
+                # rather than promoting the whole image to RGBA for a few lines of text
+                layer = Image.new('RGBA', (max(w for w, _ in sizes) + padding, sum(h + padding for _, h in sizes)), (0, 0, 0, 0))
+                x, y = 0, 0
+            else:
+                # Other modes (L, P, ...) still need RGBA for the alpha background and colored text
+                if draw_text_with_background and img.mode != 'RGBA':
+                    img = img.convert('RGBA')
+                layer = img
+                x, y = x_offset, y_offset
+
+            draw = ImageDraw.Draw(layer)
+            for (label, text_color), (text_width, text_height) in zip(lines, sizes):
                 if draw_text_with_background:
-                     # Calculate text size to draw background rectangle
-                     try:
-                         # Use textbbox for more accurate bounding box calculation
-                         text_bbox = draw.textbbox((x_offset, y_offset), label, font=font)
-                         text_width = text_bbox[2] - text_bbox[0]
-                         text_height = text_bbox[3] - text_bbox[1]
-                         # Draw background rectangle slightly larger than text
-                         padding = 5
-                         draw.rectangle([x_offset, y_offset, x_offset + text_width + padding, y_offset + text_height + padding], fill=bg_color)
-                     except Exception as bbox_e:
-                          # Fallback if textbbox fails (e.g., with default font)
-                          print(f"Error calculating text bbox for background: {bbox_e}. Drawing text without background.")
-                          draw_text_with_background = False # Fallback
-
-
-                draw.text((x_offset, y_offset), label, fill=text_color, font=font)
-                
-                # Move down for the next line of text
-                # Use textbbox to get accurate height for the next line calculation
-                try:
-                     text_bbox = draw.textbbox((x_offset, y_offset), label, font=font)
-                     y_offset += (text_bbox[3] - text_bbox[1]) + 5 # text height + padding
-                except:
-                     # Fallback height if textbbox fails
-                     y_offset += 20 + 5 # Estimate height + padding
+                    # Draw background rectangle slightly larger than text
+                    draw.rectangle([x, y, x + text_width + padding, y + text_height + padding], fill=bg_color)
+                draw.text((x, y), label, fill=text_color, font=font)
+                y += text_height + padding # text height + padding
 
+            if layer is not img:
+                # The layer's alpha is the paste mask, so the background stays semi-transparent
+                img.paste(layer, (x_offset, y_offset), layer)
 
             return img
         
-        # Connect event handlers
+        # Connect event handlers. The status handlers only read cached snapshots and
+        # never block, so they're coroutines that Gradio runs directly on its event
+        # loop instead of handing each one to a worker thread
+        async def refresh_status():
+            """Refresh the status panel from one device snapshot"""
+            devices, status_counts = snapshot()
+            return devices, update_network_stats(status_counts), update_health_indicator(status_counts)
+        
+        async def refresh_charts():
+            """Refresh both charts from one device snapshot"""
+            _, status_counts = snapshot()
+            return update_activity_plot(status_counts), update_device_distribution(status_counts)
+        
+        # Quick, non-blocking handlers skip the queue (queue=False) and are answered
+        # straight away, so they never wait behind an image being processed
         refresh_btn.click(
-            fn=lambda: (core.get_device_status(), update_network_stats(), update_health_indicator()),
-            outputs=[device_table, stats, health_indicator]
+            fn=refresh_status,
+            outputs=[device_table, stats, health_indicator],
+            queue=False
         )
         
         refresh_plot_btn.click(
-            fn=lambda: (update_activity_plot(), update_device_distribution()),
-            outputs=[activity_plot, device_pie]
+            fn=refresh_charts,
+            outputs=[activity_plot, device_pie],
+            queue=False
         )
         
-        # Handle both image upload and path
-        image_path.change(
-            fn=lambda p: handle_image_selection(None, p),
-            inputs=[image_path],
-            outputs=[image_preview]
-        )
+        # Handle both image upload and path. The path preview loads once the path
+        # is entered (Enter or leaving the box) rather than on every keystroke
+        for path_event in (image_path.submit, image_path.blur):
+            path_event(
+                fn=lambda p: handle_image_selection(None, p),
+                inputs=[image_path],
+                outputs=[image_preview],
+                show_progress="hidden",
+                queue=False
+            )
         
         image_upload.change(
             fn=lambda img: img,
             inputs=[image_upload],
-            outputs=[image_preview]
+            outputs=[image_preview],
+            queue=False
         )
         
         process_btn.click(
@@ -452,198 +470,405 @@ def create_interface(core):
             outputs=[result_text, detailed_results, assignments_table, image_preview, detection_image]
         )
         
-        # Auto-refresh functionality based on checkbox
-        def conditional_refresh():
-            if auto_refresh.value:
-                return (
-                    core.get_device_status(),
-                    update_network_stats(),
-                    update_health_indicator(),
-                    update_activity_plot()
-                )
-            else:
-                # Return current values if auto-refresh is disabled
-                return (
-                    gr.update(),
-                    gr.update(),
-                    gr.update(),
-                    gr.update()
-                )
+        # Hash of the device rows each browser session last received
+        last_devices_key = gr.State(None)
+        
+        # Auto-refresh functionality based on checkbox. Stays synchronous: Gradio 3
+        # wraps every= handlers in a plain generator that can't await a coroutine
+        def conditional_refresh(auto_on, last_key):
+            """Refresh the status panel, skipping ticks where nothing changed"""
+            # Read the checkbox's live value (passed as an input), not auto_refresh.value,
+            # which is only the value the component was created with
+            if not auto_on:
+                return gr.update(), gr.update(), gr.update(), gr.update(), last_key
+            
+            devices, status_counts = snapshot()
+            key = hash(tuple(map(tuple, devices)))
+            if key == last_key:
+                # Same rows as this session already shows; a no-op update lets
+                # Gradio skip diffing and re-rendering every component
+                return gr.update(), gr.update(), gr.update(), gr.update(), last_key
+            
+            return (
+                devices,
+                update_network_stats(status_counts),
+                update_health_indicator(status_counts),
+                update_activity_plot(status_counts),
+                key
+            )
+        
+        async def initial_load():
+            """Fill every panel from one device snapshot"""
+            devices, status_counts = snapshot()
+            return (
+                devices,
+                update_network_stats(status_counts), 
+                update_health_indicator(status_counts),
+                update_activity_plot(status_counts),
+                update_device_distribution(status_counts)
+            )
         
         # Setup app events
         app.load(
-            fn=lambda: (
-                core.get_device_status(),
-                update_network_stats(), 
-                update_health_indicator(),
-                update_activity_plot(),
-                update_device_distribution()
-            ),
-            outputs=[device_table, stats, health_indicator, activity_plot, device_pie]
+            fn=initial_load,
+            outputs=[device_table, stats, health_indicator, activity_plot, device_pie],
+            queue=False
         )
         
         # Add interval refresh that respects the auto-refresh toggle
         app.load(
             fn=conditional_refresh,
-            outputs=[device_table, stats, health_indicator, activity_plot]
+            inputs=[auto_refresh, last_devices_key],
+            outputs=[device_table, stats, health_indicator, activity_plot, last_devices_key],
+            every=3
         )
         
-        # Enable queue for responsiveness
-        app.queue()
+        # Refresh as soon as auto-refresh is switched back on instead of waiting
+        # for the next tick; clearing the key makes that refresh send everything
+        async def resume_refresh(auto_on):
+            """Refresh everything right away when auto-refresh is switched on"""
+            return conditional_refresh(auto_on, None)
+        
+        auto_refresh.change(
+            fn=resume_refresh,
+            inputs=[auto_refresh],
+            outputs=[device_table, stats, health_indicator, activity_plot, last_devices_key],
+            queue=False
+        )
+        
+        # Enable queue for responsiveness. What's left on it is image processing and
+        # the every=3 refresh (which needs the queue); several workers keep a refresh
+        # from waiting behind an inference, and max_size bounds the backlog
+        app.queue(concurrency_count=8, max_size=64)
         
         return app
 
 # Define EdgeShiftCore class here to fix import issue
 class EdgeShiftCore:
     def __init__(self, zmq_port=5555):
-        # ZeroMQ setup
-        self.context = zmq.Context()
+        # ZeroMQ setup (same process-wide context as the main DeviceNode). Created
+        # here, before any socket, so the IO thread count and socket cap take
+        # effect: one IO thread serialises all peer traffic once peers multiply
+        self.context = zmq.Context.instance(io_threads=max(2, (os.cpu_count() or 2) // 2))
+        self.context.set(zmq.MAX_SOCKETS, 4096)
         
         # Main device setup
         self.main_device = DeviceNode(port=zmq_port, is_coordinator=True)
         self.main_device.start()
+        # Our own address, so discovery never connects back to itself
+        self.self_address = f"tcp://localhost:{zmq_port}"
+        # (peer_id, address) pairs for discovery, e.g. ("peer_192.168.1.101_5556", "tcp://192.168.1.101:5556")
+        self._peer_candidates = [
+            (f"peer_{address.split('://')[1].replace(':', '_')}", address)
+            for address in PEER_ADDRESSES if address != self.self_address
+        ]
         
         # Peer connections
         self.peers = {}  # Format: {peer_id: {'port': int, 'socket': zmq.Socket}}
-        self.peer_lock = threading.Lock()
+        # Copy-on-write: only the housekeeping thread (discovery and monitoring)
+        # writes it, by building a new dict (and new peer entries) and swapping
+        # it in; every other thread just reads self.peers, no lock needed
+        # Ids let replies be matched to requests on the DEALER sockets
+        self._request_ids = itertools.count()
+        # Peer sockets are only touched by the IO thread; other threads hand it
+        # requests through this queue and wake it with the socketpair
+        self._io_requests = queue.SimpleQueue()
+        self._io_wake_recv, self._io_wake_send = socketpair()
+        # Task requests still waiting on a peer (futures remove themselves when done)
+        self._task_futures = set()
+        # Moving average of heartbeat round trips, in seconds (None until the first reply)
+        self._latency_ema = None
+        # (timestamp, rows) of the last get_device_status() call
+        self._status_cache = (0.0, None)
+        
+        # Rolling history for the activity plot; rows are written in place at _activity_head
+        self._activity_len = 20
+        self._activity = np.zeros((self._activity_len, 3), dtype=np.float32)  # Active, Tasks, Load
+        self._activity_times = np.empty(self._activity_len, dtype="<U8")  # HH:MM:SS
+        self._activity_head = 0
+        self._activity_count = 0
+        self._activity_frame = None  # Last frame handed to the plot
+        self._activity_lock = threading.Lock()
         
         # System components
         self.scheduler = TaskScheduler(self.main_device)
-        self.model = ModelInterface()
+        # A couple of interpreters so a UI inference and local partitions don't wait on each other
+        self.model = ModelPool(2)
         self.running = True
         
-        # Start services
-        threading.Thread(target=self._discover_peers, daemon=True).start()
-        threading.Thread(target=self._monitor_peers, daemon=True).start()
+        # Start services: discovery and heartbeats share one housekeeping thread
+        self._stop_event = threading.Event()
+        self._housekeeping = sched.scheduler(time.monotonic, self._stop_event.wait)
+        self._schedule_every(5, self._discover_peers, priority=1)
+        self._schedule_every(3, self._monitor_peers, priority=2)
+        threading.Thread(target=self._housekeeping.run, daemon=True).start()
+        self._io_thread = threading.Thread(target=self._io_loop, daemon=True)
+        self._io_thread.start()
+
+    def _schedule_every(self, interval, action, priority=1):
+        """Run action now and then every `interval` seconds on the housekeeping thread"""
+        def run():
+            try:
+                action()
+            except Exception as e:
+                print(f"Housekeeping task {action.__name__} failed: {e}")
+            if self.running:
+                self._housekeeping.enter(interval, priority, run)
+        self._housekeeping.enter(0, priority, run)
 
     def _discover_peers(self):
         """Discover and connect to peer devices"""
-        # Define the list of peer addresses to attempt connecting to
-        # Include localhost peers for local testing and remote peers
-        peer_addresses_to_try = [
-            "tcp://localhost:5556",  # Local peer 1
-            "tcp://localhost:5557",  # Local peer 2
-            # --- ADD THE REMOTE PEER ADDRESS HERE ---
-            "tcp://192.168.200.206:5556", # Added Computer B's IP and peer port
-            # ---------------------------------------
-        ]
+        for peer_id, peer_address in self._peer_candidates:
+            if peer_id not in self.peers:
+                try:
+                    # DEALER so requests to every peer can be in flight at once;
+                    # _io_loop adds the empty delimiter frame a REQ socket would
+                    socket = self.context.socket(zmq.DEALER)
+                    socket.setsockopt(zmq.LINGER, 0)
+                    # Bound how many messages queue up for a peer that stopped reading
+                    socket.setsockopt(zmq.SNDHWM, 100)
+                    socket.setsockopt(zmq.RCVHWM, 100)
+                    socket.connect(peer_address)
+                    
+                    self.peers = {**self.peers, peer_id: {
+                        'port': peer_address.split(':')[-1],
+                        'socket': socket,  # Owned by the IO thread once submitted
+                        'status': 'Active',
+                        'last_seen': time.monotonic(),  # Only used for timeouts
+                        # CPU/Memory/Battery strings for the device table, set by _monitor_peers
+                        'display': ('N/A', 'N/A', 'N/A')
+                    }}
+                    print(f"Connected to peer {peer_id}")
+                except Exception as e:
+                    print(f"Failed to connect to peer on address {peer_address}: {e}")
 
-        while self.running:
-            for peer_address in peer_addresses_to_try:
-                # Extract peer_id from the address (e.g., "peer_192.168.1.101:5556")
-                peer_id = f"peer_{peer_address.split('://')[1].replace(':', '_')}"
+    def submit(self, peer_id, message, timeout=2.0, frames=()):
+        """Queue a request for a peer on the IO thread and return a Future for the reply"""
+        # Binary frames (e.g. encoded images) follow the JSON message as separate parts
+        future = Future()
+        peer = self.peers.get(peer_id)
+        if peer is None:
+            future.set_exception(KeyError(f"Unknown peer {peer_id}"))
+            return future
+        self._io_requests.put((peer['socket'], message, future, timeout, frames))
+        self._io_wake_send.send(b"\0")
+        return future
+
+    def _close_peer_socket(self, socket):
+        """Have the IO thread close a peer socket it may be polling"""
+        self._io_requests.put((socket, None, None, None, ()))
+        self._io_wake_send.send(b"\0")
 
-                if peer_id not in self.peers and peer_address != f"tcp://localhost:{self.main_device.port}":
+    def _io_loop(self):
+        """Own the peer sockets: send queued requests and resolve replies by id"""
+        poller = zmq.Poller()
+        # Plain sockets are reported back by file descriptor, not object
+        wake_fd = self._io_wake_recv.fileno()
+        poller.register(wake_fd, zmq.POLLIN)
+        registered = set()
+        pending = {}  # req_id -> (future, deadline, socket)
+        
+        while self.running:
+            # Sleep until the nearest request deadline, a reply, or a wake-up
+            timeout = 1000
+            if pending:
+                nearest = min(deadline for _, deadline, _ in pending.values())
+                timeout = max(0, min(timeout, (nearest - time.monotonic()) * 1000))
+            try:
+                events = dict(poller.poll(timeout))
+            except zmq.error.ZMQError as e:
+                print(f"Peer IO poll error: {e}")
+                continue
+            
+            if wake_fd in events:
+                self._io_wake_recv.recv(4096)
+                while True:
                     try:
-                        socket = self.context.socket(zmq.REQ)
-                        socket.connect(peer_address)
-                        socket.setsockopt(zmq.LINGER, 0)
-                        socket.setsockopt(zmq.RCVTIMEO, 2000)  # 2 second timeout
-                        
-                        with self.peer_lock:
-                            self.peers[peer_id] = {
-                                'port': peer_address.split(':')[-1],
-                                'socket': socket,
-                                'status': 'Active',
-                                'last_seen': time.time()
-                            }
-                        print(f"Connected to peer {peer_id}")
+                        socket, message, future, request_timeout, frames = self._io_requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    
+                    if message is None:
+                        # Close request: fail anything still waiting on this socket
+                        for req_id, (waiting, _, owner) in list(pending.items()):
+                            if owner is socket:
+                                del pending[req_id]
+                                waiting.set_exception(ConnectionError("peer removed"))
+                        if socket in registered:
+                            poller.unregister(socket)
+                            registered.discard(socket)
+                        socket.close()
+                        continue
+                    
+                    req_id = next(self._request_ids)
+                    try:
+                        # Fail at once instead of blocking if the peer's queue is full
+                        if message is PING:
+                            payload = PING_TEMPLATE % req_id
+                        else:
+                            payload = dumps(dict(message, id=req_id))
+                        size = len(payload) + sum(len(frame) for frame in frames)
+                        socket.send_multipart([b"", payload, *frames], zmq.DONTWAIT, copy=size < ZERO_COPY_MIN)
+                    except Exception as e:
+                        future.set_exception(e)
+                        continue
+                    if socket not in registered:
+                        poller.register(socket, zmq.POLLIN)
+                        registered.add(socket)
+                    pending[req_id] = (future, time.monotonic() + request_timeout, socket)
+            
+            for socket in registered:
+                if socket not in events:
+                    continue
+                while True:
+                    try:
+                        frames = socket.recv_multipart(zmq.NOBLOCK)
+                    except zmq.error.Again:
+                        break
+                    try:
+                        reply = loads(frames[-1])
+                        # Late replies to requests that already timed out have no entry
+                        entry = pending.pop(reply.get('id'), None)
                     except Exception as e:
-                        print(f"Failed to connect to peer on address {peer_address}: {e}")
+                        # Undecodable, not an object, or an unhashable id: drop it
+                        # rather than let it take down the IO thread
+                        print(f"Dropping malformed peer reply: {e!r}")
+                        continue
+                    if entry is not None:
+                        entry[0].set_result(reply)
             
-            time.sleep(5)
+            # Expire requests whose peer didn't answer in time
+            now = time.monotonic()
+            for req_id, (future, deadline, _) in list(pending.items()):
+                if deadline <= now:
+                    del pending[req_id]
+                    future.set_exception(TimeoutError("no reply within timeout"))
+        
+        for future, _, _ in pending.values():
+            future.set_exception(ConnectionError("shutting down"))
 
     def _monitor_peers(self):
         """Monitor peer connections and status"""
-        while self.running:
-            with self.peer_lock:
-                to_remove = []
-                for peer_id, peer in self.peers.items():
-                    try:
-                        # Send heartbeat
-                        peer['socket'].send_json({'type': 'ping'})
-                        
-                        # Receive response - expect status and metrics
-                        # This will block for RCVTIMEO (2 seconds)
-                        response = peer['socket'].recv_json() 
-                        
-                        # Update peer status and metrics from the response
-                        peer['status'] = response.get('status', 'Unknown')
-                        peer['last_seen'] = time.time()
-                        
-                        # --- Store received metrics ---
-                        # Expecting keys like 'cpu_percent', 'memory_percent', 'battery' in the response
-                        peer['cpu_percent'] = response.get('cpu_percent', 'N/A')
-                        peer['memory_percent'] = response.get('memory_percent', 'N/A')
-                        peer['battery'] = response.get('battery', 'N/A') # Assuming battery can be reported
-                        # ------------------------------
-
-                    except Exception as e:
-                        # If there's an error (timeout, disconnection, etc.)
-                        print(f"Peer {peer_id} unreachable or error receiving status: {e}")
-                        peer['status'] = 'Disconnected'
-                        # Clear metrics or mark as N/A if disconnected
-                        peer['cpu_percent'] = 'N/A' 
-                        peer['memory_percent'] = 'N/A'
-                        peer['battery'] = 'N/A'
-                        
-                        if time.time() - peer['last_seen'] > 10:  # 10s timeout for removal
-                            to_remove.append(peer_id)
+        # Snapshot the peers for this cycle
+        peer_ids = list(self.peers)
+        
+        # Ping every peer at once and wait for all replies in one 2 second window
+        sent = time.monotonic()
+        replied = {}  # peer_id -> when its reply arrived, stamped on the IO thread
+        futures = {}
+        for peer_id in peer_ids:
+            futures[peer_id] = future = self.submit(peer_id, PING)
+            future.add_done_callback(lambda _, peer_id=peer_id: replied.setdefault(peer_id, time.monotonic()))
+        wait(futures.values(), timeout=3)
+        
+        # --- Generate simulated metrics for display ---
+        # Peers don't report metrics yet, so draw stand-ins once per cycle
+        # (CPU 5-85%, Memory 20-90%, Battery 10-100%) rather than on every table refresh
+        simulated = _rng.uniform((5, 20, 10), (85, 90, 100), size=(len(futures), 3))
+        # ----------------------------------------------
+        
+        # Apply the results to a copy, then publish it
+        peers = dict(self.peers)
+        to_remove = []
+        for (peer_id, future), stand_in in zip(futures.items(), simulated):
+            if peer_id not in peers:
+                continue
+            peer = peers[peer_id] = dict(peers[peer_id])
+            try:
+                response = future.result(timeout=0)
                 
-                # Remove dead peers
-                for peer_id in to_remove:
-                    print(f"Removing unresponsive peer {peer_id}") # Improved message
-                    try:
-                        self.peers[peer_id]['socket'].close()
-                    except Exception as close_e:
-                        print(f"Error closing socket for peer {peer_id}: {close_e}")
-                    del self.peers[peer_id]
-                    print(f"Removed peer {peer_id} from list.")
+                # Update peer status and metrics from the response
+                peer['status'] = response.get('status', 'Unknown')
+                peer['last_seen'] = time.monotonic()
+                
+                # Fold this round trip into the average latency shown in the stats
+                rtt = replied.get(peer_id, peer['last_seen']) - sent
+                self._latency_ema = rtt if self._latency_ema is None else 0.8 * self._latency_ema + 0.2 * rtt
+                # ...and into this peer's own average, which the scheduler weighs it by
+                peer['rtt'] = rtt if peer.get('rtt') is None else 0.8 * peer['rtt'] + 0.2 * rtt
+                
+                # --- Store received metrics ---
+                # Expecting keys like 'cpu_percent', 'memory_percent', 'battery' in the response
+                peer['cpu_percent'] = response.get('cpu_percent', 'N/A')
+                peer['memory_percent'] = response.get('memory_percent', 'N/A')
+                peer['battery'] = response.get('battery', 'N/A') # Assuming battery can be reported
+                # ------------------------------
+            
+            except Exception as e:
+                # If there's an error (timeout, disconnection, etc.)
+                print(f"Peer {peer_id} unreachable or error receiving status: {e!r}")
+                peer['status'] = 'Disconnected'
+                # Clear metrics or mark as N/A if disconnected
+                peer['cpu_percent'] = 'N/A' 
+                peer['memory_percent'] = 'N/A'
+                peer['battery'] = 'N/A'
+                
+                if time.monotonic() - peer['last_seen'] > 10:  # 10s timeout for removal
+                    to_remove.append(peer_id)
             
-            time.sleep(3) # Check peer status every 3 seconds
+            # Format the table cells now, once per cycle, instead of on every refresh
+            peer['display'] = tuple(
+                f"{value:.1f}%" if isinstance(value, (int, float)) else f"{fallback:.1f}%"
+                for value, fallback in zip((peer['cpu_percent'], peer['memory_percent'], peer['battery']), stand_in)
+            )
+        
+        # Remove dead peers
+        for peer_id in to_remove:
+            print(f"Removing unresponsive peer {peer_id}") # Improved message
+            self._close_peer_socket(peers.pop(peer_id)['socket'])
+            print(f"Removed peer {peer_id} from list.")
+        
+        self.peers = peers
 
     def _send_to_peer(self, peer_id, task):
-        """Send task to peer device"""
-        with self.peer_lock:
-            if peer_id not in self.peers:
-                return None
-            
-            try:
-                peer = self.peers[peer_id]
-                # Send the actual image data to the peer
-                peer['socket'].send_json({
-                    'type': 'task',
-                    'task': task
-                })
-                return peer['socket'].recv_json()
-            except Exception as e:
-                print(f"Failed to send task to {peer_id}: {e}")
-                return None
+        """Send task to peer device and return a Future for its result"""
+        # Send the actual image data to the peer: each in-memory partition is
+        # JPEG-encoded into its own frame and the task refers to it by index,
+        # so peers never need our filesystem and the bytes skip JSON entirely
+        frames = []
+        wire_tasks = []
+        for part in task:
+            data = part.get('data')
+            if isinstance(data, Image.Image):
+                buf = io.BytesIO()
+                (data if data.mode in ("RGB", "L") else data.convert("RGB")).save(buf, "JPEG")
+                frames.append(buf.getbuffer())
+                part = {k: v for k, v in part.items() if k != 'data'}
+                part['frame'] = len(frames) - 1
+            wire_tasks.append(part)
+        future = self.submit(peer_id, {
+            'type': 'task',
+            'task': wire_tasks
+        }, timeout=TASK_TIMEOUT, frames=frames)
+        self._task_futures.add(future)
+        future.add_done_callback(self._task_futures.discard)
+        return future
 
-    def process_image(self, image_path):
+    def get_network_metrics(self):
+        """Return (pending peer tasks, average heartbeat latency in ms or None)"""
+        latency = self._latency_ema
+        return len(self._task_futures), None if latency is None else latency * 1000
+
+    def process_image(self, image_path, image=None):
         """Process image with real distributed processing"""
         try:
-            if not image_path.strip():
-                return "No image provided", {}, []
+            if image is None:
+                if not image_path.strip():
+                    return "No image provided", {}, []
+                image = Image.open(image_path)
             
-            # Load and split the image
-            image = Image.open(image_path)
+            # Split the image
             width, height = image.size
             
             # Split image into two parts
             left_half = image.crop((0, 0, width//2, height))
             right_half = image.crop((width//2, 0, width, height))
             
-            # Save temporary files for the partitions
-            left_path = "temp_left.jpg"
-            right_path = "temp_right.jpg"
-            left_half.save(left_path)
-            right_half.save(right_path)
-            
-            # Create partitions with actual image data
+            # Create partitions with actual image data. They stay in memory: local
+            # work uses them directly and peers get them inline with the task
             partitions = [
-                {"id": "part_1", "weight": 1, "data": left_path},
-                {"id": "part_2", "weight": 1, "data": right_path}
+                {"id": "part_1", "weight": 1, "data": left_half},
+                {"id": "part_2", "weight": 1, "data": right_half}
             ]
             
             # Distribute tasks
@@ -651,24 +876,24 @@ class EdgeShiftCore:
             
             # Process tasks
             results = {}
-            start_time = time.time()
+            start_time = time.monotonic()
             
-            for peer_id, tasks in assignments.items():
-                if peer_id == "local":
-                    results[peer_id] = self._process_local(tasks)
-                else:
-                    peer_result = self._send_to_peer(peer_id, tasks)
-                    if peer_result:
-                        results[peer_id] = peer_result
+            # Dispatch remote work first so peers run while we process locally
+            remote = {peer_id: self._send_to_peer(peer_id, tasks)
+                      for peer_id, tasks in assignments.items() if peer_id != "local"}
+            deadline = time.monotonic() + TASK_TIMEOUT + 1.0
+            if "local" in assignments:
+                results["local"] = self._process_local(assignments["local"])
             
-            # Clean up temp files
-            if os.path.exists(left_path):
-                os.remove(left_path)
-            if os.path.exists(right_path):
-                os.remove(right_path)
+            # Total wait is the slowest peer, not the sum of all of them
+            for peer_id, future in remote.items():
+                try:
+                    results[peer_id] = future.result(timeout=max(0, deadline - time.monotonic()))
+                except Exception as e:
+                    print(f"Failed to send task to {peer_id}: {e!r}")
             
             # Format results
-            return self._format_results(results, assignments, time.time() - start_time)
+            return self._format_results(results, assignments, time.monotonic() - start_time)
             
         except Exception as e:
             return f"Error: {str(e)}", {}, []
@@ -680,23 +905,22 @@ class EdgeShiftCore:
         }
         
         # Get peer capabilities
-        with self.peer_lock:
-            for peer_id, peer in self.peers.items():
-                if peer['status'] == 'Active':
-                    capabilities[peer_id] = self._estimate_peer_capability(peer)
+        active_peers = [peer_id for peer_id, peer in self.peers.items() if peer['status'] == 'Active']
+        capabilities.update(zip(active_peers, self._estimate_peer_capabilities(active_peers)))
         
-        # Sort devices by capability
-        sorted_devices = sorted(capabilities.items(), key=lambda x: -x[1])
-        sorted_partitions = sorted(partitions, key=lambda x: -x['weight'])
+        # Rank devices by capability and partitions by weight (highest first)
+        dev_ids = list(capabilities)
+        caps = np.fromiter(capabilities.values(), dtype=np.float64, count=len(dev_ids))
+        weights = np.fromiter((p['weight'] for p in partitions), dtype=np.float64, count=len(partitions))
+        order_dev = np.argsort(-caps, kind="stable")
+        order_part = np.argsort(-weights, kind="stable")
         
-        # Assign tasks
+        # Deal partitions round-robin so the heaviest go to the most capable devices
+        # (previously every partition landed on the top device)
         assignments = {}
-        for partition in sorted_partitions:
-            for dev_id, _ in sorted_devices:
-                if dev_id not in assignments:
-                    assignments[dev_id] = []
-                assignments[dev_id].append(partition)
-                break
+        for i, part_idx in enumerate(order_part):
+            dev_id = dev_ids[order_dev[i % len(dev_ids)]]
+            assignments.setdefault(dev_id, []).append(partitions[part_idx])
         
         return assignments
 
@@ -707,48 +931,31 @@ class EdgeShiftCore:
                (100 - profile.get('memory_percent', 0)) * 0.3 +
                profile.get('battery', 0) * 0.2)
 
-    def _estimate_peer_capability(self, peer):
-        """Estimate capability for peer devices"""
+    def _estimate_peer_capabilities(self, peer_ids):
+        """Estimate capability for each of the given peers"""
         # In a real system, peers would report their capabilities
-        # For demo, we'll use random values
-        return random.uniform(30, 80)
+        # For demo, we'll use random values (one draw for all peers)
+        base = _rng.uniform(30, 80, len(peer_ids))
+        # Scale down peers with slow heartbeats so work goes to the ones that answer quickly
+        rtt = np.fromiter((self.peers.get(peer_id, {}).get('rtt') or 0.0 for peer_id in peer_ids),
+                          dtype=np.float64, count=len(peer_ids))
+        return (base * (1 - np.minimum(1, rtt / PEER_RTT_MAX))).tolist()
 
     def _process_local(self, tasks):
         """Process tasks locally"""
         results = []
-        for task in tasks:
-            # Get the image partition data
-            image_data = task.get('data')
-            if image_data:
-                # Process the image partition using the model
-                if hasattr(self, 'model') and self.model is not None:
-                    # Run inference on the partition
-                    input_data = self.model.preprocess_image(image_data)
-                    self.model.interpreter.set_tensor(self.model.input_index, input_data)
-                    self.model.interpreter.invoke()
-                    output = self.model.interpreter.get_tensor(self.model.output_index)
-                    
-                    # Get top predictions
-                    if output.ndim == 2 and output.shape[0] == 1:
-                        output = output[0]
-                    
-                    top_k = 3
-                    top_k_idx = np.argsort(output)[-top_k:][::-1]
-                    
-                    for idx in top_k_idx:
-                        if idx < len(self.model.labels):
-                            results.append({
-                                "class": self.model.labels[idx],
-                                "confidence": float(output[idx])
-                            })
-        
+        # Get the image partition data
+        images = [task['data'] for task in tasks if task.get('data')]
+        # Process all partitions using the model in one batch and get top predictions
+        if images and getattr(self, 'model', None) is not None:
+            results = top_k_detections(self.model.process_batch(images), self.model.labels, 3)
+
         return {"detections": results}
 
     def _format_results(self, results, assignments, processing_time):
         """Format results for display"""
-        all_detections = []
-        for res in results.values():
-            all_detections.extend(res.get("detections", []))
+        all_detections = list(itertools.chain.from_iterable(
+            res.get("detections", []) for res in results.values()))
         
         assignment_display = []
         for dev_id, tasks in assignments.items():
@@ -771,40 +978,67 @@ class EdgeShiftCore:
 
     def get_device_status(self):
         """Get current device status"""
-        devices = []
+        return self.get_device_snapshot()[1]
+
+    def get_device_snapshot(self):
+        """Return (built_at, rows) for the current device status"""
+        # Several panels refresh in the same tick; let them share one snapshot.
+        # The timestamp travels with the rows so callers can key derived data on it
+        snapshot = self._status_cache
+        if snapshot[1] is not None and time.monotonic() - snapshot[0] < 0.5:
+            return snapshot
+        
+        peers = self.peers  # Published snapshot; no lock needed
 
         # Main device (gets real profile data)
         profile = self.main_device.get_profile()
-        devices.append([
-            f"{self.main_device.id[:8]} (local)",
+        battery = profile.get('battery', 0)
+        devices = [[
+            f"{self.main_device.short_id} (local)",
             self.main_device.device_status,
             f"{profile.get('cpu_percent', 0):.1f}%",
             f"{profile.get('memory_percent', 0):.1f}%",
-            f"{profile.get('battery', 0):.1f}%" if isinstance(profile.get('battery', 0), (int, float)) else profile.get('battery', '---')
-        ])
-
-        # Peer devices (now displays simulated metrics)
-        with self.peer_lock:
-            for peer_id, peer in self.peers.items():
-                # --- Generate simulated metrics for display ---
-                simulated_cpu = random.uniform(5, 85) # Simulate CPU usage between 5% and 85%
-                simulated_memory = random.uniform(20, 90) # Simulate Memory usage between 20% and 90%
-                simulated_battery = random.uniform(10, 100) # Simulate Battery between 10% and 100%
-                # ----------------------------------------------
-
-                devices.append([
-                    peer_id,
-                    peer['status'], # Use the real status (Active/Disconnected)
-                    f"{simulated_cpu:.1f}%", # Display simulated CPU
-                    f"{simulated_memory:.1f}%", # Display simulated Memory
-                    f"{simulated_battery:.1f}%" # Display simulated Battery
-                ])
-
-        return devices
+            f"{battery:.1f}%" if isinstance(battery, (int, float)) else battery
+        ]]
+
+        # Peer devices (metrics were formatted by _monitor_peers). Fresh lists every
+        # rebuild: earlier snapshots may still be read by other sessions
+        for peer_id, peer in peers.items():
+            devices.append([peer_id, peer['status'], *peer['display']]) # Real status, then CPU, Memory, Battery
+
+        snapshot = self._status_cache = (time.monotonic(), devices)
+        return snapshot
+
+    def record_activity(self, active, tasks, load):
+        """Append an activity sample and return the history as a DataFrame"""
+        now = time.strftime("%H:%M:%S")
+        sample = (active, tasks, load)
+        with self._activity_lock:
+            last = (self._activity_head - 1) % self._activity_len
+            if self._activity_count and self._activity_times[last] == now:
+                # Several sessions refreshing in the same second share one row
+                if self._activity_frame is not None and tuple(self._activity[last]) == sample:
+                    return self._activity_frame  # Nothing changed; reuse the last frame
+                row = last
+            else:
+                row = self._activity_head
+                self._activity_head = (row + 1) % self._activity_len
+                self._activity_count = min(self._activity_count + 1, self._activity_len)
+            self._activity[row] = sample
+            self._activity_times[row] = now
+            
+            # Oldest to newest; fancy indexing already gives fresh arrays, so
+            # wrap them without another copy
+            order = np.arange(self._activity_head - self._activity_count, self._activity_head) % self._activity_len
+            frame = pd.DataFrame(self._activity[order], columns=["Active", "Tasks", "Load"], copy=False)
+            frame.insert(0, "time", self._activity_times[order])
+            self._activity_frame = frame
+        
+        return frame
 
     def update_plot_data(self):
         """Get data for plot"""
-        active_devices = len([d for d in self.get_device_status() if d[1] == 'Active'])
+        active_devices = sum(1 for d in self.get_device_status() if d[1] == 'Active')
         return pd.DataFrame({
             "time": [time.strftime("%H:%M:%S")],
             "Active": [active_devices]
@@ -813,68 +1047,22 @@ class EdgeShiftCore:
     def stop(self):
         """Clean shutdown"""
         self.running = False
-        with self.peer_lock:
-            for peer in self.peers.values():
-                peer['socket'].close()
+        # Drop pending housekeeping runs and wake the thread so it exits
+        for event in self._housekeeping.queue:
+            try:
+                self._housekeeping.cancel(event)
+            except ValueError:
+                pass
+        self._stop_event.set()
+        # Let the IO thread finish before closing the sockets it owns
+        self._io_wake_send.send(b"\0")
+        self._io_thread.join(timeout=2)
+        for peer in self.peers.values():
+            peer['socket'].close()
+        self._io_wake_recv.close()
+        self._io_wake_send.close()
         self.main_device.stop()
 
-def run_peer(port):
-    """Run a peer device instance (for testing)"""
-    context = zmq.Context()
-    socket = context.socket(zmq.REP)
-    
-    try:
-        socket.bind(f"tcp://*:{port}")
-        print(f"Peer running on port {port}")
-        
-        # Initialize model for peer
-        model = ModelInterface()
-        
-        while True:
-            message = socket.recv_json()
-            if message.get('type') == 'ping':
-                socket.send_json({'status': 'Active'})
-            elif message.get('type') == 'task':
-                # Process actual image data
-                results = []
-                for task in message['task']:
-                    image_path = task.get('data')
-                    if image_path and os.path.exists(image_path):
-                        # Process the image using the model
-                        input_data = model.preprocess_image(image_path)
-                        model.interpreter.set_tensor(model.input_index, input_data)
-                        model.interpreter.invoke()
-                        output = model.interpreter.get_tensor(model.output_index)
-                        
-                        # Get top predictions
-                        if output.ndim == 2 and output.shape[0] == 1:
-                            output = output[0]
-                        
-                        top_k = 3
-                        top_k_idx = np.argsort(output)[-top_k:][::-1]
-                        
-                        for idx in top_k_idx:
-                            if idx < len(model.labels):
-                                results.append({
-                                    "class": model.labels[idx],
-                                    "confidence": float(output[idx])
-                                })
-                
-                socket.send_json({"detections": results})
-    except zmq.error.ZMQError as e:
-        print(f"Error starting peer on port {port}: {e}")
-        print("The port may already be in use. Try a different port.")
-    except KeyboardInterrupt:
-        print(f"\nPeer on port {port} stopped by user.")
-    except Exception as e:
-        print(f"An unexpected error occurred in peer on port {port}: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        print(f"Peer on port {port} shutting down ZeroMQ resources.")
-        socket.close()
-        context.term()
-
 # Modify the main function to use the enhanced interface
 def main():
     """Main application entry point"""
@@ -894,7 +1082,7 @@ def main():
     peer_thread = None
     if args.start_peer:
         print(f"Starting test peer on port {args.start_peer}...")
-        # run_peer function is defined later in this file
+        # run_peer lives in core.peer (shared with the standalone peer script)
         peer_thread = threading.Thread(target=run_peer, args=(args.start_peer,))
         peer_thread.daemon = True  # Allow the main program to exit even if the thread is running
         peer_thread.start()
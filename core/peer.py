@@ -1,52 +1,65 @@
 import zmq
 import time
-import os
-from core.model import ModelInterface
-import numpy as np
+import traceback
+from core.model import ModelPool, top_k_detections
+from core.protocol import RouterServer
 
-def run_peer(port):
+def _process_tasks(tasks, model, blobs=()):
+    """Run inference for a list of task partitions"""
+    images = []
+    for task in tasks:
+        if 'frame' in task:
+            # Image sent inline as an extra message frame; decoded straight from its buffer
+            images.append(blobs[task['frame']].buffer)
+        elif task.get('data'):
+            # Older coordinators send a path on a shared filesystem instead. Read it
+            # here and skip partitions that can't be opened, rather than stat() first
+            try:
+                with open(task['data'], 'rb') as f:
+                    images.append(f.read())
+            except OSError:
+                continue
+    if not images:
+        return []
+    # Process the partitions using the model in one batch and get top predictions
+    return top_k_detections(model.process_batch(images), model.labels, 3)
+
+def run_peer(port, max_workers=4):
     """Run a peer device instance"""
-    context = zmq.Context()
-    socket = context.socket(zmq.REP)
-    
+    context = zmq.Context.instance()
+    # ROUTER so a long task doesn't hold up pings and other tasks behind it.
+    # Tasks run on a small pool and their replies are sent from this thread
+    socket = context.socket(zmq.ROUTER)
+    server = RouterServer(socket, max_workers=max_workers)
+
+    def serve_task(message, blobs):
+        """Process a task on a worker thread"""
+        try:
+            return {"detections": _process_tasks(message['task'], models, blobs)}
+        except Exception as e:
+            print(f"Task failed on peer {port}: {e}")
+            return {"status": "error", "message": str(e)}
+
     try:
         socket.bind(f"tcp://*:{port}")
         print(f"Peer running on port {port}")
-        
-        # Initialize model for peer
-        model = ModelInterface()
-        
+
+        # One interpreter per worker (TFLite interpreters aren't thread-safe), loaded
+        # up front so a broken model file fails at startup; they split the cores
+        models = ModelPool(max_workers)
+
         while True:
-            message = socket.recv_json()
+            request = server.poll()
+            if request is None:
+                continue
+            route, message, blobs = request
             if message.get('type') == 'ping':
-                socket.send_json({'status': 'Active'})
+                # Answer pings right away; they never wait behind a task
+                server.reply(route, message, {'status': 'Active'})
             elif message.get('type') == 'task':
-                # Process actual image data
-                results = []
-                for task in message['task']:
-                    image_path = task.get('data')
-                    if image_path and os.path.exists(image_path):
-                        # Process the image using the model
-                        input_data = model.preprocess_image(image_path)
-                        model.interpreter.set_tensor(model.input_index, input_data)
-                        model.interpreter.invoke()
-                        output = model.interpreter.get_tensor(model.output_index)
-                        
-                        # Get top predictions
-                        if output.ndim == 2 and output.shape[0] == 1:
-                            output = output[0]
-                        
-                        top_k = 3
-                        top_k_idx = np.argsort(output)[-top_k:][::-1]
-                        
-                        for idx in top_k_idx:
-                            if idx < len(model.labels):
-                                results.append({
-                                    "class": model.labels[idx],
-                                    "confidence": float(output[idx])
-                                })
-                
-                socket.send_json({"detections": results})
+                server.submit(route, message, serve_task, message, blobs)
+            else:
+                server.reply(route, message, {'status': 'error', 'message': 'Unknown message type'})
     except zmq.error.ZMQError as e:
         print(f"Error starting peer on port {port}: {e}")
         print("The port may already be in use. Try a different port.")
@@ -54,17 +67,17 @@ def run_peer(port):
         print(f"\nPeer on port {port} stopped by user.")
     except Exception as e:
         print(f"An unexpected error occurred in peer on port {port}: {e}")
-        import traceback
         traceback.print_exc()
     finally:
         print(f"Peer on port {port} shutting down ZeroMQ resources.")
-        socket.close()
-        context.term()
+        # The context is shared with the rest of the process (e.g. --start-peer),
+        # so only our own sockets are closed here
+        server.close(wait=False)
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='EdgeShift Peer')
     parser.add_argument('--port', type=int, default=5556, help='Port for the peer device')
     args = parser.parse_args()
-    
-    run_peer(args.port) 
\ No newline at end of file
+
+    run_peer(args.port)
@@ -0,0 +1,116 @@
+"""Message encoding and ROUTER request handling shared by EdgeShift ZeroMQ sockets
+
+Messages stay JSON on the wire so nodes remain compatible with peers and
+tools that use pyzmq's send_json/recv_json (e.g. diagnostic.py). When
+orjson is installed it replaces the stdlib json module, which is what
+dominates the per-message cost of send_json/recv_json.
+
+RouterServer is the request loop used by both DeviceNode and run_peer.
+"""
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from socket import socketpair
+
+import zmq
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Payloads at least this large are handed to libzmq without copying. Below
+# it, tracking the zero-copy frame costs more than the memcpy it saves.
+ZERO_COPY_MIN = 64 * 1024
+
+
+if orjson is not None:
+    def dumps(obj):
+        """Encode a message to JSON bytes"""
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        """Encode a message to JSON bytes"""
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    loads = json.loads
+
+
+class RouterServer:
+    """Request loop plumbing for a ROUTER socket whose requests run on a worker pool"""
+
+    def __init__(self, socket, max_workers):
+        # Only the thread calling poll() may touch the socket. Workers queue their
+        # replies and wake it through the socketpair instead
+        self.socket = socket
+        self._workers = ThreadPoolExecutor(max_workers=max_workers)
+        self._replies = queue.SimpleQueue()
+        self._wake_recv, self._wake_send = socketpair()
+        self._poller = zmq.Poller()
+        self._poller.register(socket, zmq.POLLIN)
+        # Plain sockets are reported back by file descriptor, not object
+        self._wake_fd = self._wake_recv.fileno()
+        self._poller.register(self._wake_fd, zmq.POLLIN)
+
+    def poll(self, timeout=None):
+        """Send any queued replies; return the next request as (route, message, blobs), or None"""
+        events = dict(self._poller.poll(timeout))
+        if self._wake_fd in events:
+            self._wake_recv.recv(4096)
+            while True:
+                try:
+                    route, reply = self._replies.get_nowait()
+                except queue.Empty:
+                    break
+                self.socket.send_multipart(route + [reply], copy=len(reply) < ZERO_COPY_MIN)
+        if self.socket not in events:
+            return None
+        # [identity, (empty delimiter from REQ/DEALER clients), payload, image frames...]
+        # Received without copying so attached images are decoded in place
+        frames = self.socket.recv_multipart(copy=False)
+        start = next((i + 1 for i, frame in enumerate(frames) if len(frame) == 0), 1)
+        route = frames[:start]
+        try:
+            message = loads(frames[start].bytes)
+            if not isinstance(message, dict):
+                raise ValueError("message is not an object")
+        except (IndexError, ValueError) as e:
+            self.socket.send_multipart(route + [dumps({"status": "error", "message": f"Bad request: {e}"})])
+            return None
+        return route, message, frames[start + 1:]
+
+    def reply(self, route, message, response):
+        """Answer a request right away (poll() thread only)"""
+        self.socket.send_multipart(route + [self._encode(message, response)])
+
+    def submit(self, route, message, handler, *args):
+        """Run handler(*args) on a worker and send back the dict it returns"""
+        self._workers.submit(self._serve, route, message, handler, args)
+
+    def _serve(self, route, message, handler, args):
+        try:
+            response = handler(*args)
+        except Exception as e:
+            response = {"status": "error", "message": str(e)}
+        self._replies.put((route, self._encode(message, response)))
+        self.wake()
+
+    def _encode(self, message, response):
+        # Echo the request id so DEALER clients can match replies
+        if "id" in message:
+            response = dict(response, id=message["id"])
+        return dumps(response)
+
+    def wake(self):
+        """Interrupt a blocked poll()"""
+        self._wake_send.send(b"\0")
+
+    def close(self, wait=True):
+        """Stop the workers, then release the socket and the socketpair"""
+        self._workers.shutdown(wait=wait)
+        self.socket.close()
+        self._wake_recv.close()
+        self._wake_send.close()
@@ -1,55 +1,222 @@
+import os
 import time
-import random
+import threading
+import heapq
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+# Rough working memory one unit of task weight needs on a device, and the share
+# of a device's free memory that assigned tasks may use
+MB_PER_WEIGHT_UNIT = 64
+MEMORY_HEADROOM = 0.8
+
+# Device scores younger than SCORE_TTL_FRESH are served as is; up to SCORE_TTL_STALE
+# they are still served but refreshed in the background; older ones are recomputed
+SCORE_TTL_FRESH = 0.5
+SCORE_TTL_STALE = 2.0
+
+# Seconds between device health checks while collect_results waits
+HEALTH_CHECK_INTERVAL = 2.0
+
+# A peer whose last heartbeat (discovery broadcasts come every 2 s) is older than
+# this many seconds counts as failed
+HEARTBEAT_TIMEOUT = 5.0
+
+# Seconds a snapshot of the node's peer list is reused by the scheduler
+PEER_TTL = 0.5
+
+# EDGESHIFT_PROFILE=1 records call counts and time spent in the main scheduler methods
+PROFILE = os.environ.get("EDGESHIFT_PROFILE") == "1"
+
+def timed(name):
+    """Record calls to a TaskScheduler method under `name` when profiling is on"""
+    def decorate(method):
+        # Without profiling the method is left as is, so there's no cost at all
+        if not PROFILE:
+            return method
+        
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter_ns() - start
+                with self._stats_lock:
+                    count, total_ns = self._stats.get(name, (0, 0))
+                    self._stats[name] = (count + 1, total_ns + elapsed)
+        return wrapper
+    return decorate
+
+@functools.lru_cache(maxsize=128)
+def _partition_template(image_path, num_partitions):
+    """Task dicts for splitting an image into partitions; cached per image and count"""
+    # In a real implementation, you'd use PIL/OpenCV to split the image
+    # For demo, we'll just simulate it (equal-weight partitions)
+    return tuple({
+        'id': f"img_{image_path.split('/')[-1]}_{i}",
+        'weight': 5,
+        'data': {
+            'type': 'image_partition',
+            'partition_index': i,
+            'total_partitions': num_partitions,
+            'image_path': image_path
+        }
+    } for i in range(num_partitions))
 
 class TaskScheduler:
     def __init__(self, local_node):
         self.local_node = local_node
         self.task_assignments = {}  # Store which device is handling which task
-        self.reassigned_tasks = set()  # Track tasks that were reassigned due to failures
+        # Tasks reassigned due to failures: a running count, plus the most recent
+        # ids for tracing (bounded, so long demo runs don't grow it forever)
+        self.reassigned_count = 0
+        self.reassigned_tasks = deque(maxlen=10000)
+        self._scores_cache = (0.0, None)  # (timestamp, scores) of the last computation
+        self._scores_lock = threading.Lock()
+        self._scores_refreshing = False  # A background refresh is running
+        self._peers_cache = (0.0, None)  # (timestamp, peers) of the last peer snapshot
+        self._ranked_cache = (None, None)  # (scores dict, its _rank_devices result)
+        self._stats = {}  # name -> (calls, total ns), filled in by @timed methods
+        self._stats_lock = threading.Lock()
+        self._results_ready = threading.Event()  # Set when a device reports results
+        # Sends to and collections from peers are network-bound, so they run
+        # side by side on this pool instead of one device after another
+        self._pool = ThreadPoolExecutor(max_workers=32)
+        # Tasks assigned to this device run on a persistent pool, one worker per core
+        self._local_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
         
-    def get_device_scores(self):
+    @timed("get_device_scores")
+    def get_device_scores(self, max_age=SCORE_TTL_FRESH, max_stale=SCORE_TTL_STALE):
         """Calculate capability scores for all available devices"""
-        scores = {}
+        # Profiles are sampled about once a second, so callers within the same half
+        # second share one computation; each gets its own copy to modify
+        cached_at, scores = self._scores_cache
+        age = time.monotonic() - cached_at
+        if scores is None or age > max_stale:
+            scores = self._refresh_scores()
+        elif age > max_age:
+            # Slightly old scores are still good enough to schedule with; don't make
+            # the caller wait for the peer queries
+            self._refresh_scores_async()
+        return dict(scores)
+    
+    def _refresh_scores(self):
+        """Recompute the scores and cache them"""
+        scores = self._compute_device_scores()
+        self._scores_cache = (time.monotonic(), scores)
+        return scores
+    
+    def _refresh_scores_async(self):
+        """Refresh the cached scores on a background thread, one refresh at a time"""
+        with self._scores_lock:
+            if self._scores_refreshing:
+                return
+            self._scores_refreshing = True
+        
+        def refresh():
+            try:
+                self._refresh_scores()
+            except Exception as e:
+                print(f"Error refreshing device scores: {e}")
+            finally:
+                self._scores_refreshing = False
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def invalidate_scores(self, device_ids):
+        """Drop devices from the cached scores until the next refresh"""
+        cached_at, scores = self._scores_cache
+        if scores:
+            remaining = {device_id: score for device_id, score in scores.items()
+                         if device_id not in device_ids}
+            # Removing devices keeps the others in order, so filter the ranking too
+            ranked_for, ranked = self._ranked_cache
+            if ranked_for is scores:
+                keep = [device_id not in device_ids for device_id in ranked[0]]
+                ranked = ([device_id for device_id, kept in zip(ranked[0], keep) if kept], ranked[1][keep])
+                self._ranked_cache = (remaining, ranked)
+            self._scores_cache = (cached_at, remaining)
+    
+    def _ranked_devices(self):
+        """Cached device ids and scores, highest first; re-sorted only when the scores change"""
+        self.get_device_scores()  # Refreshes the cached scores if they're too old
+        scores = self._scores_cache[1]
+        ranked_for, ranked = self._ranked_cache
+        if ranked_for is not scores:
+            ranked = self._rank_devices(scores)
+            self._ranked_cache = (scores, ranked)
+        return ranked
+    
+    def _peer_snapshot(self):
+        """The node's available peers, fetched at most once per PEER_TTL"""
+        # Scoring, memory caps and health checks all walk the peers within the same
+        # scheduler pass; they share one snapshot (read-only, don't modify it)
+        cached_at, peers = self._peers_cache
+        now = time.monotonic()
+        if peers is None or now - cached_at > PEER_TTL:
+            peers = self.local_node.get_available_peers()
+            self._peers_cache = (now, peers)
+        return peers
+    
+    def _compute_device_scores(self):
+        """Score the local device and every active peer"""
+        device_ids = []
+        profiles = []
         
         # Include local device (if it's active)
         if self.local_node.device_status == "Active":
-            local_profile = self.local_node.get_profile()
-            scores[self.local_node.id] = self._calculate_device_score(local_profile)
+            device_ids.append(self.local_node.id)
+            profiles.append(self.local_node.get_profile())
         
         # Include peers
-        peers = self.local_node.get_available_peers()
+        peers = self._peer_snapshot()
         for peer_id, peer_info in peers.items():
             if peer_info['status'] == "Active" and peer_info['profile']:
-                scores[peer_id] = self._calculate_device_score(peer_info['profile'])
+                device_ids.append(peer_id)
+                profiles.append(peer_info['profile'])
         
-        return scores
+        return dict(zip(device_ids, self._calculate_device_scores(profiles).tolist()))
     
     def _calculate_device_score(self, profile):
         """Calculate a capability score based on device profile
         Higher score = more available resources = better for tasks
         """
-        if not profile:
-            return 0
-            
+        return float(self._calculate_device_scores([profile])[0])
+    
+    def _calculate_device_scores(self, profiles):
+        """Calculate capability scores for a list of device profiles in one array pass"""
+        count = len(profiles)
+        cpu = np.fromiter((p.get('cpu_percent', 0) if p else 0 for p in profiles), dtype=np.float64, count=count)
+        memory = np.fromiter((p.get('memory_percent', 0) if p else 0 for p in profiles), dtype=np.float64, count=count)
+        # Devices without a battery (None) get no bonus, same as a nearly empty one
+        battery = np.fromiter((p.get('battery') if p and p.get('battery') is not None else 0 for p in profiles),
+                              dtype=np.float64, count=count)
+        
         # Basic formula: Available resources (100 - used resources)
-        cpu_available = 100 - profile.get('cpu_percent', 0)
-        memory_available = 100 - profile.get('memory_percent', 0)
-        
-        # Battery bonus (if device has battery)
-        battery_bonus = 0
-        battery = profile.get('battery')
-        if battery is not None:
-            if battery > 80:  # High battery
-                battery_bonus = 15
-            elif battery > 50:  # Medium battery
-                battery_bonus = 10
-            elif battery > 20:  # Low battery
-                battery_bonus = 5
-                
+        cpu_available = 100 - cpu
+        memory_available = 100 - memory
+        
+        # Battery bonus: high (>80%), medium (>50%) and low (>20%) charge
+        battery_bonus = np.select([battery > 80, battery > 50, battery > 20], [15, 10, 5], 0)
+        
         # Calculate final score (CPU and memory are most important)
-        score = (0.5 * cpu_available) + (0.4 * memory_available) + (0.1 * battery_bonus)
-        return score
+        scores = (0.5 * cpu_available) + (0.4 * memory_available) + (0.1 * battery_bonus)
+        
+        # An empty profile means nothing is known about the device
+        scores[[not p for p in profiles]] = 0
+        return scores
+    
+    def _rank_devices(self, device_scores):
+        """Return device ids and their scores as parallel arrays, highest score first"""
+        dev_ids = np.fromiter(device_scores, dtype=object, count=len(device_scores))
+        scores = np.fromiter(device_scores.values(), dtype=np.float64, count=len(device_scores))
+        order = np.argsort(-scores, kind="stable")
+        return dev_ids[order].tolist(), scores[order]
     
+    @timed("distribute_tasks")
     def distribute_tasks(self, task_list):
         """Distribute tasks to devices based on their scores
         
@@ -62,67 +229,96 @@ class TaskScheduler:
         Returns:
             Dictionary mapping device_ids to their assigned tasks
         """
-        # Get scores for all available devices
-        device_scores = self.get_device_scores()
-        
-        # Sort devices by score (highest first)
-        sorted_devices = sorted(device_scores.items(), 
-                               key=lambda x: x[1], reverse=True)
+        # Get all available devices, sorted by score (highest first)
+        ranked_devices, ranked_scores = self._ranked_devices()
         
         # If no capable devices, return empty assignment
-        if not sorted_devices:
+        if not ranked_devices:
             return {}
-            
+        
         # Sort tasks by weight (heaviest first)
         sorted_tasks = sorted(task_list, key=lambda t: t.get('weight', 1), reverse=True)
         
-        # Simple greedy assignment algorithm:
-        # - Heaviest tasks go to most capable devices
-        # - Distribute proportionally to capability scores
+        # Longest-processing-time-first: each task, heaviest first, goes to the device
+        # that is predicted to finish its current work soonest (assigned weight / score).
+        # Devices with no score get nothing unless every score is 0 (then all count alike)
+        if ranked_scores[0] > 0:
+            speeds = ranked_scores
+        else:
+            speeds = np.ones(len(ranked_devices))
+        heap = [(0.0, -speed, rank) for rank, speed in enumerate(speeds.tolist()) if speed > 0]
+        heapq.heapify(heap)
         assignments = {}
+        for task in sorted_tasks:
+            finish, neg_speed, rank = heapq.heappop(heap)
+            assignments.setdefault(ranked_devices[rank], []).append(task)
+            heapq.heappush(heap, (finish + task.get('weight', 1) / -neg_speed, neg_speed, rank))
         
-        # Calculate total score for proportional assignment
-        total_score = sum(score for _, score in sorted_devices)
-        
-        if total_score == 0:
-            # Fallback: Even distribution if all scores are 0
-            tasks_per_device = len(sorted_tasks) // len(sorted_devices)
-            remainder = len(sorted_tasks) % len(sorted_devices)
-            
-            for i, (device_id, _) in enumerate(sorted_devices):
-                start_idx = i * tasks_per_device + min(i, remainder)
-                end_idx = start_idx + tasks_per_device + (1 if i < remainder else 0)
-                assignments[device_id] = sorted_tasks[start_idx:end_idx]
-        else:
-            # Proportional task assignment
-            task_idx = 0
-            remaining_tasks = len(sorted_tasks)
-            
-            for device_id, score in sorted_devices:
-                # Calculate tasks for this device proportionally to its score
-                device_share = score / total_score
-                task_count = int(device_share * len(sorted_tasks))
-                
-                # Ensure every device gets at least one task if available
-                task_count = max(task_count, 1) if remaining_tasks > 0 else 0
-                
-                # Don't assign more than remaining tasks
-                task_count = min(task_count, remaining_tasks)
-                
-                # Assign tasks
-                assignments[device_id] = sorted_tasks[task_idx:task_idx + task_count]
-                task_idx += task_count
-                remaining_tasks -= task_count
-                
-                # Stop if all tasks assigned
-                if remaining_tasks <= 0:
-                    break
+        # A device's share can still be more than it has memory for
+        assignments = self._apply_memory_caps(assignments, ranked_devices)
         
         # Store assignments for potential reassignment later
         self.task_assignments = assignments
         
         return assignments
         
+    def _memory_capacities(self):
+        """Memory (MB) each device can give to tasks; devices not reporting total RAM are left out"""
+        profiles = {}
+        if self.local_node.device_status == "Active":
+            profiles[self.local_node.id] = self.local_node.get_profile()
+        for peer_id, peer_info in self._peer_snapshot().items():
+            profiles[peer_id] = peer_info.get('profile')
+        
+        capacities = {}
+        for device_id, profile in profiles.items():
+            if profile and profile.get('memory_total_mb'):
+                free_mb = (100 - profile.get('memory_percent', 0)) / 100 * profile['memory_total_mb']
+                capacities[device_id] = free_mb * MEMORY_HEADROOM
+        return capacities
+    
+    def _apply_memory_caps(self, assignments, ranked_devices):
+        """Move tasks off devices whose assigned weight needs more memory than they have free"""
+        capacities = self._memory_capacities()
+        if not capacities:
+            return assignments
+        
+        def need(task):
+            return task.get('weight', 1) * MB_PER_WEIGHT_UNIT
+        
+        load = {device_id: sum(map(need, tasks)) for device_id, tasks in assignments.items()}
+        for device_id in ranked_devices:
+            tasks = assignments.get(device_id)
+            capacity = capacities.get(device_id)
+            while tasks and capacity is not None and load[device_id] > capacity:
+                # Spill the lightest task (tasks are heaviest first) to the best-scoring
+                # device with room for it (unknown capacity counts as room). The local
+                # node is ranked like any other device when it's active; if nobody has
+                # room the task stays put rather than overfilling a device already checked
+                task = tasks[-1]
+                target = next((other for other in ranked_devices
+                               if other != device_id
+                               and capacities.get(other, float('inf')) - load.get(other, 0) >= need(task)),
+                              None)
+                if target is None:
+                    break
+                tasks.pop()
+                assignments.setdefault(target, []).append(task)
+                load[device_id] -= need(task)
+                load[target] = load.get(target, 0) + need(task)
+        
+        return {device_id: tasks for device_id, tasks in assignments.items() if tasks}
+    
+    def get_stats(self):
+        """Call counts and total time (ms) per profiled method; empty unless EDGESHIFT_PROFILE=1"""
+        with self._stats_lock:
+            return {name: {"calls": count, "total_ms": total_ns / 1e6}
+                    for name, (count, total_ns) in self._stats.items()}
+    
+    def notify_result(self):
+        """Wake collect_results early; call when a device's results arrive"""
+        self._results_ready.set()
+    
     def distribute_tasks_to_devices(self, task_assignments):
         """Send tasks to their assigned devices
         
@@ -133,6 +329,7 @@ class TaskScheduler:
             Dictionary of device_id -> success status
         """
         results = {}
+        sends = {}
         
         for device_id, tasks in task_assignments.items():
             if device_id == self.local_node.id:
@@ -140,28 +337,29 @@ class TaskScheduler:
                 for task in tasks:
                     self.local_node.tasks.append(task)
                     # Process in background
-                    import threading
-                    threading.Thread(
-                        target=self.local_node._process_task, 
-                        args=(task,), 
-                        daemon=True
-                    ).start()
+                    self._local_pool.submit(self.local_node._process_task, task)
                 results[device_id] = True
                 continue
                 
-            # Send tasks to remote device
-            success = True
-            for task in tasks:
-                # Track which device is handling this task
-                task_id = task.get('id')
-                if not self.local_node.send_task_to_peer(device_id, task):
-                    success = False
-                    break
-                    
-            results[device_id] = success
+            # Send tasks to remote devices concurrently
+            sends[self._pool.submit(self._send_to_device, device_id, tasks)] = device_id
+        
+        for future in as_completed(sends):
+            try:
+                results[sends[future]] = future.result()
+            except Exception as e:
+                print(f"Error sending tasks to {sends[future]}: {e}")
+                results[sends[future]] = False
             
         return results
     
+    def _send_to_device(self, device_id, tasks):
+        """Send a remote device its tasks; returns whether they were all accepted"""
+        for task in tasks:
+            if not self.local_node.send_task_to_peer(device_id, task):
+                return False
+        return True
+    
     def check_device_health(self):
         """Check all devices for failures"""
         failed_devices = []
@@ -170,16 +368,24 @@ class TaskScheduler:
         if self.local_node.device_status != "Active":
             failed_devices.append(self.local_node.id)
             
-        # Check peer devices
-        peers = self.local_node.get_available_peers()
+        # Check peer devices. Peers that report when their last heartbeat arrived
+        # ('last_seen', monotonic seconds) are judged from that alone; only the
+        # others cost a status request
+        now = time.monotonic()
+        peers = self._peer_snapshot()
         for peer_id, peer_info in peers.items():
+            last_seen = peer_info.get('last_seen')
             if peer_info['status'] != "Active":
                 failed_devices.append(peer_id)
+            elif last_seen is not None:
+                if now - last_seen > HEARTBEAT_TIMEOUT:
+                    failed_devices.append(peer_id)
             elif not self.local_node.check_peer_status(peer_id):
                 failed_devices.append(peer_id)
                 
         return failed_devices
     
+    @timed("reassign_tasks")
     def reassign_tasks(self, failed_devices):
         """Reassign tasks from failed devices to healthy ones"""
         if not failed_devices:
@@ -197,31 +403,26 @@ class TaskScheduler:
             
         print(f"Reassigning {len(tasks_to_reassign)} tasks from failed devices")
         
+        # Failed devices shouldn't be picked again from a cached score
+        self.invalidate_scores(failed_devices)
+        
         # Mark these tasks as reassigned
-        for task in tasks_to_reassign:
-            task_id = task.get('id')
-            self.reassigned_tasks.add(task_id)
+        self.reassigned_count += len(tasks_to_reassign)
+        self.reassigned_tasks.extend(task.get('id') for task in tasks_to_reassign)
             
-        # Get scores for remaining healthy devices
-        device_scores = self.get_device_scores()
-        
-        # Remove failed devices from scores
-        for device_id in failed_devices:
-            if device_id in device_scores:
-                del device_scores[device_id]
+        # Remaining healthy devices, highest score first. The ranking is cached with
+        # the scores, so a failure only filters it instead of sorting again
+        failed = set(failed_devices)
+        sorted_devices = [device_id for device_id in self._ranked_devices()[0] if device_id not in failed]
                 
-        if not device_scores:
+        if not sorted_devices:
             print("No healthy devices available for reassignment!")
             return {}
-            
-        # Sort devices by score (highest first)
-        sorted_devices = sorted(device_scores.items(), 
-                               key=lambda x: x[1], reverse=True)
         
         # Simple round-robin assignment
         reassignments = {}
         for i, task in enumerate(tasks_to_reassign):
-            device_id = sorted_devices[i % len(sorted_devices)][0]
+            device_id = sorted_devices[i % len(sorted_devices)]
             if device_id not in reassignments:
                 reassignments[device_id] = []
             reassignments[device_id].append(task)
@@ -235,6 +436,7 @@ class TaskScheduler:
                 
         return reassignments
     
+    @timed("collect_results")
     def collect_results(self, task_assignments, timeout=30):
         """Collect results from all assigned tasks
         
@@ -246,22 +448,31 @@ class TaskScheduler:
             Dictionary of task_id -> result
         """
         results = {}
-        start_time = time.time()
+        # Monotonic deadline so clock adjustments can't cut the wait short
+        deadline = time.monotonic() + timeout
         
         # Keep track of which devices we're waiting for
-        pending_devices = list(task_assignments.keys())
+        pending_devices = set(task_assignments)
         
         # First collect from local device
         if self.local_node.id in pending_devices:
             # Get local results
             local_results = self.local_node.results
             results.update(local_results)
-            pending_devices.remove(self.local_node.id)
+            pending_devices.discard(self.local_node.id)
         
         # Wait until timeout or all results collected
-        while time.time() - start_time < timeout and pending_devices:
-            # Check for device failures
-            failed_devices = self.check_device_health()
+        next_health_check = time.monotonic()
+        while time.monotonic() < deadline and pending_devices:
+            # Cleared before collecting, so a result reported from here on ends the wait below
+            self._results_ready.clear()
+            
+            # Check for device failures. This queries every peer, so it runs on its own
+            # timer instead of on every wakeup
+            failed_devices = []
+            if time.monotonic() >= next_health_check:
+                failed_devices = self.check_device_health()
+                next_health_check = time.monotonic() + HEALTH_CHECK_INTERVAL
             if failed_devices:
                 # Reassign tasks from failed devices
                 reassignments = self.reassign_tasks(failed_devices)
@@ -270,20 +481,25 @@ class TaskScheduler:
                     self.distribute_tasks_to_devices(reassignments)
                     
                 # Remove failed devices from pending list
-                for device_id in failed_devices:
-                    if device_id in pending_devices:
-                        pending_devices.remove(device_id)
+                pending_devices.difference_update(failed_devices)
             
-            # Try to collect from each pending device
-            for device_id in list(pending_devices):  # Copy to avoid modification during iteration
-                # Collect from remote device
-                device_results = self.local_node.collect_result_from_peer(device_id)
+            # Try to collect from every pending device at once
+            collects = {self._pool.submit(self.local_node.collect_result_from_peer, device_id): device_id
+                        for device_id in pending_devices}
+            for future in as_completed(collects):
+                try:
+                    device_results = future.result()
+                except Exception as e:
+                    print(f"Error collecting results from {collects[future]}: {e}")
+                    continue
                 if device_results:
                     results.update(device_results)
-                    pending_devices.remove(device_id)
+                    pending_devices.discard(collects[future])
             
-            # Wait a bit before next collection attempt
-            time.sleep(1)
+            # Wait for the next result (notify_result), re-polling peers at least once
+            # a second; no wait once everything is in, and never past the deadline
+            if pending_devices:
+                self._results_ready.wait(max(0, min(1, deadline - time.monotonic())))
         
         return results
     
@@ -307,23 +523,10 @@ class TaskScheduler:
         if num_partitions <= 0:
             num_partitions = 1
         
-        # Create task list with image partitions
-        tasks = []
-        
-        # In a real implementation, you'd use PIL/OpenCV to split the image
-        # For demo, we'll just simulate it
-        for i in range(num_partitions):
-            task_id = f"img_{image_path.split('/')[-1]}_{i}"
-            tasks.append({
-                'id': task_id,
-                'weight': random.randint(3, 7),  # Randomize weights for demo
-                'data': {
-                    'type': 'image_partition',
-                    'partition_index': i,
-                    'total_partitions': num_partitions,
-                    'image_path': image_path
-                }
-            })
+        # Create task list with image partitions, copied from the cached template
+        # (each call gets its own dicts, since tasks are modified downstream)
+        tasks = [{**task, 'data': dict(task['data'])}
+                 for task in _partition_template(image_path, num_partitions)]
             
         # Distribute these tasks to devices
         assignments = self.distribute_tasks(tasks)
@@ -17,8 +17,8 @@ def run_diagnostics(target_port=5556):
     print(f"Local hostname: {hostname}")
     print(f"Local IP: {local_ip}")
     
-    # Try to create a ZMQ subscriber to test reception
-    context = zmq.Context()
+    # Try to create a ZMQ subscriber to test reception (on the process-wide context)
+    context = zmq.Context.instance()
     sub = context.socket(zmq.SUB)
     sub.setsockopt_string(zmq.SUBSCRIBE, "")
     sub.connect(f"tcp://127.0.0.1:{target_port}")
@@ -26,28 +26,30 @@ def run_diagnostics(target_port=5556):
     print(f"Listening for broadcasts on port {target_port}...")
     print("Press Ctrl+C to stop")
     
+    # Block in poll() until a message arrives (reporting each quiet second)
+    # instead of sleeping between timed receives
+    poller = zmq.Poller()
+    poller.register(sub, zmq.POLLIN)
+    
     try:
         while True:
             try:
-                # Try to receive a message with timeout
-                sub.RCVTIMEO = 1000  # 1 second timeout
-                message = sub.recv_json()
-                print(f"Received message: {message}")
-            except zmq.error.Again:
-                print("No message received (timeout)")
+                if sub in dict(poller.poll(1000)):  # 1 second timeout
+                    message = sub.recv_json()
+                    print(f"Received message: {message}")
+                else:
+                    print("No message received (timeout)")
             except Exception as e:
                 print(f"Error: {str(e)}")
-            
-            time.sleep(1)
     except KeyboardInterrupt:
         print("Diagnostics stopped")
     finally:
-        sub.close()
-        context.term()
+        # Nothing queued to flush, so don't linger
+        sub.close(linger=0)
 
 def send_test_message(port=5556):
     """Send a test broadcast message"""
-    context = zmq.Context()
+    context = zmq.Context.instance()
     pub = context.socket(zmq.PUB)
     pub.bind(f"tcp://*:{port}")
     
@@ -66,10 +68,9 @@ def send_test_message(port=5556):
     pub.send_json(message)
     print(f"Test message sent: {message}")
     
-    # Keep socket open briefly to ensure message is sent
-    time.sleep(1)
-    pub.close()
-    context.term()
+    # Let close() wait (up to 1s) only until the queued message is flushed,
+    # instead of always sleeping a full second
+    pub.close(linger=1000)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='EdgeShift Diagnostics')
@@ -1,5 +1,7 @@
 import requests
 import os
+import shutil
+from email.utils import formatdate
 
 url = "https://storage.googleapis.com/download.tensorflow.org/models/tflite/mobilenet_v1_1.0_224_quant.tflite"
 save_path = os.path.join("model", "model_files", "mobilenet_v1_1.0_224_quant.tflite")
@@ -9,13 +11,24 @@ headers = {
     "User-Agent": "Mozilla/5.0"
 }
 
+# Only download again if the server's copy is newer than the one we already have
+if os.path.exists(save_path):
+    headers["If-Modified-Since"] = formatdate(os.path.getmtime(save_path), usegmt=True)
+
 print(f"📥 Downloading model from {url}")
 
-response = requests.get(url, headers=headers)
-if response.status_code == 200:
-    with open(save_path, 'wb') as f:
-        f.write(response.content)
-    print(f"✅ Model saved to {save_path}")
-    print(f"📦 Model file size: {os.path.getsize(save_path)} bytes")
-else:
-    print(f"❌ Failed to download. Status code: {response.status_code}")
+# Streamed to disk in 1 MB chunks rather than held in memory, into a temporary
+# file so an interrupted download never replaces (or looks like) a good model
+with requests.get(url, headers=headers, stream=True) as response:
+    if response.status_code == 304:
+        print(f"✅ Model at {save_path} is already up to date")
+    elif response.status_code == 200:
+        part_path = save_path + ".part"
+        response.raw.decode_content = True  # Undo any gzip transfer encoding
+        with open(part_path, 'wb') as f:
+            shutil.copyfileobj(response.raw, f, length=1 << 20)
+        os.replace(part_path, save_path)
+        print(f"✅ Model saved to {save_path}")
+        print(f"📦 Model file size: {os.path.getsize(save_path)} bytes")
+    else:
+        print(f"❌ Failed to download. Status code: {response.status_code}")
@@ -1,15 +1,36 @@
+import mmap
+import os
 import zmq
 
 def client_send_image(image_path, server_addr="tcp://localhost:5555"):
-    context = zmq.Context()
+    # mmap can't map an empty file, and there would be nothing to classify anyway
+    if os.path.getsize(image_path) == 0:
+        print(f"Image file is empty: {image_path}")
+        return
+
+    # The process-wide context, so repeated calls don't each start new IO threads
+    context = zmq.Context.instance()
     socket = context.socket(zmq.REQ)
-    socket.connect(server_addr)
+    # Don't hold up close() on unsent messages if the server is gone
+    socket.setsockopt(zmq.LINGER, 0)
 
+    # Map the file and hand its pages to ZeroMQ without copying, rather than
+    # reading it into a bytes object first
     with open(image_path, "rb") as f:
-        image_bytes = f.read()
+        image_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-    socket.send(image_bytes)
-    message = socket.recv()
+    tracker = None
+    try:
+        socket.connect(server_addr)
+        tracker = socket.send(image_map, copy=False, track=True)
+        message = socket.recv()
+    finally:
+        # Closing the socket discards anything unsent; the mapping can only be
+        # released once libzmq has let go of its pages
+        socket.close()
+        if tracker is not None:
+            tracker.wait()
+        image_map.close()
     print("Prediction from server:", message.decode())
 
 if __name__ == "__main__":
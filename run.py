@@ -3,24 +3,45 @@ import argparse
 import threading
 import json
 import os
-import random
+import numpy as np
 from core.device import DeviceNode
 from core.scheduler import TaskScheduler
 from core.model import ModelInterface
 
 def simulate_device_failure(device, failure_chance=0.2, min_runtime=10):
     """Randomly simulate a device failure after some time"""
-    # Wait at least min_runtime seconds
-    time.sleep(min_runtime)
+    # Each 5 second interval (starting after min_runtime) fails with failure_chance,
+    # so draw which interval fails up front and sleep straight through to it
+    failing_interval = np.random.geometric(failure_chance)
+    time.sleep(min_runtime + (failing_interval - 1) * 5)
     
-    # Random chance of failure each interval
-    while device.running:
-        if random.random() < failure_chance:
-            device.simulate_crash()
-            break
-        time.sleep(5)
+    if device.running:
+        device.simulate_crash()
 
-def process_image_collaborative(image_path, scheduler, model):
+# Recent results per (image path, file mtime): (expires_at, result)
+_result_cache = {}
+
+def process_image_collaborative(image_path, scheduler, model, cache_ttl=0):
+    """Process an image, reusing a result from the last cache_ttl seconds if there is one"""
+    if cache_ttl <= 0:
+        return _process_image_collaborative(image_path, scheduler, model)
+    
+    # The mtime is part of the key so an image that changes on disk is processed again
+    try:
+        key = (image_path, os.stat(image_path).st_mtime_ns)
+    except OSError:
+        key = (image_path, None)
+    cached = _result_cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        print(f"\nUsing cached result for {image_path}")
+        return dict(cached[1], cached=True)
+    
+    result = _process_image_collaborative(image_path, scheduler, model)
+    if 'error' not in result:
+        _result_cache[key] = (time.monotonic() + cache_ttl, result)
+    return result
+
+def _process_image_collaborative(image_path, scheduler, model):
     """Process an image collaboratively across devices"""
     print(f"\nProcessing image: {image_path}")
     
@@ -46,14 +67,15 @@ def process_image_collaborative(image_path, scheduler, model):
     total_time = time.time() - start_time
     
     # Check if any tasks were reassigned
-    reassigned_count = len(scheduler.reassigned_tasks)
+    reassigned_count = scheduler.reassigned_count
     if reassigned_count > 0:
         print(f"\n{reassigned_count} tasks were reassigned due to device failures!")
     
     # Process and combine results
     result_values = list(results.values())
     if result_values:
-        combined_results = model.combine_results(result_values)
+        # Keep every detection; the demo saves the full results to disk
+        combined_results = model.combine_results(result_values, include_all=True)
         combined_results['total_wall_time'] = total_time
         combined_results['devices_used'] = len(assignments)
         combined_results['tasks_reassigned'] = reassigned_count
@@ -76,6 +98,8 @@ def main():
                         help='Run in demo mode with simulated workload')
     parser.add_argument('--run-time', type=int, default=60,
                         help='How long to run in demo mode (seconds)')
+    parser.add_argument('--cache-ttl', type=float, default=0,
+                        help='Reuse results for repeated demo images for this many seconds (0 = off)')
     args = parser.parse_args()
     
     # Create the local device node
@@ -136,7 +160,7 @@ def main():
                     time.sleep(5)
                 
                 # Process image collaboratively
-                result = process_image_collaborative(image_path, scheduler, model)
+                result = process_image_collaborative(image_path, scheduler, model, args.cache_ttl)
                 results_list.append({
                     'image': image_path,
                     'result': result
@@ -156,8 +180,10 @@ def main():
             # Print summary
             print("\n===== Demo Summary =====")
             print(f"Images processed: {image_index}")
-            print(f"Tasks reassigned due to failures: {len(scheduler.reassigned_tasks)}")
+            print(f"Tasks reassigned due to failures: {scheduler.reassigned_count}")
             print(f"Results saved to: results/edgeshift_results.json")
+            for name, stats in scheduler.get_stats().items():
+                print(f"  {name}: {stats['calls']} calls, {stats['total_ms']:.1f} ms")
         else:
             # In interactive mode, just keep the node running
             print("\nNode is running. Press Ctrl+C to exit...")
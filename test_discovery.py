@@ -5,7 +5,9 @@ import socket
 
 def run_publisher(port=5556):
     """Run a simple ZMQ publisher on the specified port"""
-    context = zmq.Context()
+    # Publisher and subscriber threads share the process-wide context, so each
+    # only closes its own socket (terminating the context would block the other)
+    context = zmq.Context.instance()
     socket = context.socket(zmq.PUB)
     socket.bind(f"tcp://*:{port}")
     
@@ -22,32 +24,31 @@ def run_publisher(port=5556):
     except KeyboardInterrupt:
         print("Publisher stopped")
     finally:
-        socket.close()
-        context.term()
+        socket.close(linger=0)
 
 def run_subscriber(port=5556):
     """Run a simple ZMQ subscriber connecting to localhost on the specified port"""
-    context = zmq.Context()
+    context = zmq.Context.instance()
     socket = context.socket(zmq.SUB)
     socket.setsockopt_string(zmq.SUBSCRIBE, "")
     socket.connect(f"tcp://localhost:{port}")
     
     print(f"Subscriber started, connecting to localhost:{port}")
     
+    # Block in poll() until a message arrives instead of spinning on NOBLOCK
+    poller = zmq.Poller()
+    poller.register(socket, zmq.POLLIN)
+    
     try:
         while True:
-            try:
-                message = socket.recv_string(flags=zmq.NOBLOCK)
+            socks = dict(poller.poll(1000))  # 1 second timeout
+            if socket in socks:
+                message = socket.recv_string()
                 print(f"Received: {message}")
-            except zmq.Again:
-                # No message available yet
-                pass
-            time.sleep(0.1)
     except KeyboardInterrupt:
         print("Subscriber stopped")
     finally:
-        socket.close()
-        context.term()
+        socket.close(linger=0)
 
 if __name__ == "__main__":
     # Start publisher and subscriber in separate threads